@@ -0,0 +1,51 @@
+#!/usr/bin/env python
+"""
+Compares ``common.cleanup_markup`` with the former three-regex version on
+the titles and descriptions found in recorded search feeds.
+
+Usage: cleanup_markup.py FEED_FILE [FEED_FILE ...]
+
+(See ``feed_parser.py`` on how to record feeds.)
+"""
+import os
+import re
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import common
+from feed import parse_feed
+
+REPEAT = 5
+
+_old_cleanup_regexes = (
+    (re.compile(r'(?P<amp>&)(?P<X>\w*[^;\w])'), lambda m: '&amp;'+m.group('X')),
+    (re.compile(r'<br/?>'), ''),
+    (re.compile(r'</?a.*?>'), '')
+)
+def old_cleanup_markup(s):
+    for pattern, replace in _old_cleanup_regexes:
+        s = pattern.sub(replace, s)
+    return s
+
+def uncached_cleanup_markup(s):
+    return common._markup_token.sub(common._replace_markup_token, s)
+
+def bench(func, corpus):
+    return min(timeit.repeat(lambda: map(func, corpus), repeat=REPEAT, number=1)) * 1000
+
+
+if __name__ == '__main__':
+    corpus = []
+    for path in sys.argv[1:]:
+        for entry in parse_feed(path):
+            corpus.extend(s for s in (entry['title'], entry['description']) if s)
+
+    differences = [s for s in corpus if old_cleanup_markup(s) != common.cleanup_markup(s)]
+    print '{0} strings, {1} with different output:'.format(len(corpus), len(differences))
+    for s in differences:
+        print '  {0!r}\n    old: {1!r}\n    new: {2!r}'.format(s, old_cleanup_markup(s),
+                                                            common.cleanup_markup(s))
+    print 'old:                 {0:8.2f} ms'.format(bench(old_cleanup_markup, corpus))
+    print 'single pass:         {0:8.2f} ms'.format(bench(uncached_cleanup_markup, corpus))
+    print 'single pass, cached: {0:8.2f} ms'.format(bench(common.cleanup_markup, corpus))
@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""
+Compares the gdata-based feed parsing with the streaming ``feed`` parser.
+
+Usage: feed_parser.py FEED_FILE [FEED_FILE ...]
+
+Feed files can be recorded using e.g.::
+
+    curl -o feed.xml 'http://gdata.youtube.com/feeds/api/videos?vq=foo&racy=include'
+"""
+import os
+import sys
+import timeit
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import gdata.youtube
+
+import youtube
+from feed import parse_feed
+
+REPEAT = 5
+NUMBER = 20
+
+
+def parse_with_gdata(data):
+    feed = gdata.youtube.YouTubeVideoFeedFromString(data)
+    return [youtube.Video.from_feed_entry(entry) for entry in feed.entry]
+
+def parse_streaming(path):
+    return [youtube.Video(**fields) for fields in parse_feed(path)]
+
+def first_entry_streaming(path):
+    return next(parse_feed(path))
+
+def bench(func, arg):
+    best = min(timeit.repeat(lambda: func(arg), repeat=REPEAT, number=NUMBER))
+    return best / NUMBER * 1000
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:]:
+        with open(path) as f:
+            data = f.read()
+        print '{0} ({1} entries, {2} KB):'.format(path, len(parse_streaming(path)), len(data) / 1024)
+        print '  gdata:                 {0:8.2f} ms'.format(bench(parse_with_gdata, data))
+        print '  streaming:             {0:8.2f} ms'.format(bench(parse_streaming, path))
+        print '  streaming, 1st entry:  {0:8.2f} ms'.format(bench(first_entry_streaming, path))
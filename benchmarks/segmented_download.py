@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+"""
+Compares single-connection, multi-connection and adaptive segmented
+downloading against a local HTTP server that throttles its responses.
+
+Usage: segmented_download.py [SIZE_KB [RATE_KB]]
+
+The server sends at most RATE_KB (default: 256) kilobytes per second over
+each connection ("per-connection" throttling, like video CDNs do) or over
+all connections together ("shared", i.e., a slow link) of a SIZE_KB
+(default: 4096) kilobyte file.
+"""
+import os
+import re
+import sys
+import time
+import tempfile
+import threading
+import SocketServer
+import BaseHTTPServer
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from download import Downloader
+from transport import HTTPTransport
+
+CHUNK_SIZE = 16 * 1024
+SETUPS = (
+    ('1 connection',            dict(connections=1)),
+    ('4 connections',           dict(connections=4)),
+    ('adaptive, up to 8',       dict(connections=8, adaptive=True)),
+)
+
+
+class _Throttle(object):
+    def __init__(self, rate):
+        self.rate = rate
+        self.next_send = time.time()
+        self.lock = threading.Lock()
+
+    def wait(self, size):
+        with self.lock:
+            now = time.time()
+            self.next_send = max(self.next_send, now) + float(size) / self.rate
+            delay = self.next_send - now
+        time.sleep(delay)
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    data = ''
+    rate = 0
+    shared_throttle = None
+
+    def do_GET(self):
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        start, end = int(match.group(1)), min(int(match.group(2)) + 1, len(self.data))
+        self.send_response(206)
+        self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, len(self.data)))
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        throttle = self.shared_throttle or _Throttle(self.rate)
+        for offset in xrange(start, end, CHUNK_SIZE):
+            chunk = self.data[offset:min(offset + CHUNK_SIZE, end)]
+            throttle.wait(len(chunk))
+            self.wfile.write(chunk)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        pass
+
+
+def bench(url, options):
+    path = tempfile.mktemp()
+    transport = HTTPTransport(pool_size=options['connections'])
+    downloader = Downloader(url, path, transport, segment_size=256 * 1024, **options)
+    started = time.time()
+    downloader.start()
+    while downloader.running:
+        time.sleep(0.01)
+    duration = time.time() - started
+    downloader.close()
+    os.remove(path)
+    return duration, downloader.connections
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) * 1024 if len(sys.argv) > 1 else 4096 * 1024
+    rate = int(sys.argv[2]) * 1024 if len(sys.argv) > 2 else 256 * 1024
+    _Handler.data = os.urandom(size)
+    _Handler.rate = rate
+
+    server = _Server(('127.0.0.1', 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:{0}/video'.format(server.server_port)
+
+    for throttling in ('per-connection', 'shared'):
+        _Handler.shared_throttle = _Throttle(rate) if throttling == 'shared' else None
+        print '{0} KB, {1} KB/s {2}:'.format(size / 1024, rate / 1024, throttling)
+        for name, options in SETUPS:
+            duration, connections = bench(url, options)
+            print '  {0:20} {1:6.2f} s  {2:7.0f} KB/s  ({3} connections at the end)'.format(
+                name + ':', duration, size / 1024 / duration, connections)
@@ -1,127 +1,337 @@
+import os
+import time
 import tempfile
 
 import gobject
-import gst
 
-from common import STATE_BUFFERING, STATE_NULL, STATE_PAUSED, STATE_PLAYING
+import container
+from cache import MediaCache
+from common import DEFAULT_TEMPFILE_DIR, STATE_BUFFERING, STATE_NULL, STATE_PAUSED, STATE_PLAYING
+from download import BLOCK_SIZE, Downloader, required_buffer
+from transport import HTTPTransport
+
+#: Directory the downloaded streams are kept in by default
+MEDIA_CACHE_DIR = os.path.join(tempfile.gettempdir(), DEFAULT_TEMPFILE_DIR, 'media')
+#: Seconds between two updates of a download's state in the media cache
+STATE_SAVE_INTERVAL = 1
+#: Seconds of media that are buffered at least before playback starts, and
+#: as long as the download rate hasn't been measured yet
+MIN_BUFFER_SECONDS = 1
+FALLBACK_BUFFER_SECONDS = 5
 
 class BufferException(BaseException):
     pass
 
 
 class Buffer(gobject.GObject):
-    # TODO: One buffer for each video -- one buffer file for each video
 
     __gtype_name__ = 'Buffer'
     __gsignals__ = {
         'ready': (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, ()),
-        'update': (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,))
+        'update': (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT,)),
+        # download rate (bytes per second) and ETA (seconds, -1 if unknown)
+        'progress': (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, (gobject.TYPE_FLOAT, gobject.TYPE_FLOAT))
         }
 
-    def __init__(self):
+    def __init__(self, transport=None, connections=1, adaptive=True, media_cache=None):
+        """
+        :param transport:
+            The ``HTTPTransport`` to download with. By default, the buffer
+            gets one of its own, with a connection pool of ``connections``
+            per host, so that the download doesn't wait for other requests
+            (which would skew its throughput measurements).
+        :param media_cache:
+            The ``MediaCache`` that keeps the downloaded data of each video.
+        :param connections:
+            Maximum number of connections used to download a stream.
+        :param adaptive:
+            Whether to find out the number of connections that actually
+            speeds up the download (see ``download.Downloader``).
+        """
 
         gobject.GObject.__init__(self)
 
         self.state = STATE_NULL
         self.ready = False
         self.eos = False
-        self.update_timeout = None
-
-        self.pipeline = gst.parse_launch('souphttpsrc name=src ! filesink name=sink sync=false')
-        self.src = self.pipeline.get_by_name('src')
-        self.sink = self.pipeline.get_by_name('sink')
-        self.foo = self.pipeline.get_by_name('foo')
-
-        self.bus = self.pipeline.get_bus()
-        self.bus.add_signal_watch()
-        self.bus.connect("message", self.bus_message_cb)
-
-
-        self.test_pipeline = gst.parse_launch('filesrc name=test_src ! decodebin2 name=decoder ! fakesink')
-        self.test_src = self.test_pipeline.get_by_name('test_src')
-        self.test_decoder = self.test_pipeline.get_by_name('decoder')
-
-        self.test_decoder.connect('autoplug-continue', self.autoplug_continue_cb)
-
-        self.test_bus = self.test_pipeline.get_bus()
-        self.test_bus.add_signal_watch()
-        self.test_bus.connect("message", self.test_bus_message_cb)
-
+        self._update_pending = False
+
+        self.transport = transport or HTTPTransport(pool_size=connections)
+        self.connections = connections
+        self.adaptive = adaptive
+        self.downloader = None
+        self.seek_index = None
+        self._seek_position = None
+        self.key = None
+        self._state_saved = 0
+
+        if media_cache is None:
+            media_cache = MediaCache(MEDIA_CACHE_DIR)
+        self.media_cache = media_cache
+
+
+    def check_ready(self):
+        """
+        Emits 'ready' if everything needed to start playback has been
+        downloaded, and makes sure that it's downloaded first otherwise.
+        """
+
+        downloader = self.downloader
+        if downloader.size is None:
+            return
 
-    def emit_ready(self):
+        try:
+            ranges = container.startup_ranges(downloader.read, downloader.size)
+        except container.NeedData, exc:
+            # e.g. the header of a 'moov' box at the end of the file
+            ranges = [(exc.start, exc.end)]
+        except container.ContainerError:
+            # Nothing we know; let GStreamer figure it out.
+            ranges = [(0, min(downloader.size, BLOCK_SIZE))]
+
+        missing = [gap for start, end in ranges for gap in downloader.missing(start, end)]
+        if missing:
+            for start, end in missing:
+                downloader.prioritize(start, end)
+            return
 
-        if self.pipeline.query_position(gst.FORMAT_BYTES, None)[0] <= 200000:
-            return True
+        try:
+            self.seek_index = container.seek_index(downloader.read, downloader.size)
+        except (container.NeedData, container.ContainerError):
+            self.seek_index = None
 
-        self.emit('ready')
         self.ready = True
-        self.test_pipeline.set_state(gst.STATE_NULL)
-
-        self.test_pipeline = gst.parse_launch('filesrc name=test_src ! decodebin2 name=decoder ! fakesink')
-        self.test_src = self.test_pipeline.get_by_name('test_src')
-        self.test_decoder = self.test_pipeline.get_by_name('decoder')
+        if self._seek_position is not None:
+            position, self._seek_position = self._seek_position, None
+            self.seek(position)
+        self.emit('ready')
 
-        self.test_decoder.connect('autoplug-continue', self.autoplug_continue_cb)
 
-        self.test_bus = self.test_pipeline.get_bus()
-        self.test_bus.add_signal_watch()
-        self.test_bus.connect("message", self.test_bus_message_cb)
+    @property
+    def rate(self):
+        """
+        The current download rate in bytes per second (or ``None``).
+        """
 
-        return False
+        return self.downloader and self.downloader.rate
 
 
-    def autoplug_continue_cb(self, bin, pad, caps):
+    @property
+    def eta(self):
+        """
+        The estimated number of seconds until the stream is downloaded
+        completely (or ``None``).
+        """
 
-        gobject.timeout_add(100, lambda *args: self.emit_ready())
+        return self.downloader and self.downloader.eta
 
 
-    def bus_message_cb(self, bus, message):
+    def _progress_cb(self, downloader):
 
-        t = message.type
+        # Called from the download threads (among others); handle it in the
+        # main loop (once, no matter how many notifications arrive meanwhile).
+        if not self._update_pending:
+            self._update_pending = True
+            gobject.idle_add(self._update_idle_cb, downloader)
 
-        if t == gst.MESSAGE_EOS:
-            self.eos = True
 
+    def _update_idle_cb(self, downloader):
 
-    def test_bus_message_cb(self, bus, message):
+        self._update_pending = False
+        if downloader is self.downloader:
+            self.update()
+        return False
 
-        t = message.type
 
-        if t == gst.MESSAGE_ERROR:
-            self.test_pipeline.set_state(gst.STATE_NULL)
+    def update(self):
+        """
+        Emits 'progress', 'update' and, once playback can start, 'ready' for
+        the current state of the download.
+        """
 
+        downloader = self.downloader
 
-    def update(self):
+        eta = downloader.eta
+        self.emit('progress', downloader.rate or 0, -1 if eta is None else eta)
 
         if self.eos:
             self.emit('update', 100)
             return
-        try:
-            duration = self.pipeline.query_duration(gst.FORMAT_BYTES, None)[0]
-            position = max(0, self.pipeline.query_position(gst.FORMAT_BYTES, None)[0] - 500000)
-            if position == 0:
-                self.emit('update', -1)
-            else:
-                self.emit('update', max(0, (float(position) / float(duration) * 100)))
-            if not self.ready:
-                self.test_pipeline.set_state(gst.STATE_PLAYING)
-        except gst.QueryError:
-            self.emit('update', -1)
-
-        return True
 
+        if not self.ready:
+            self.check_ready()
+        if downloader.complete:
+            self.eos = True
+            self.save_state()
+            self.emit('update', 100)
+            return
+        if time.time() - self._state_saved >= STATE_SAVE_INTERVAL:
+            self.save_state()
+        if downloader.size is None:
+            self.emit('update', -1)
+            return
 
-    def load(self, uri):
+        playhead = downloader.playhead
+        position = self._position_for(playhead + downloader.available(playhead))
+        if position <= self.position:
+            self.emit('update', -1)
+        else:
+            self.emit('update', position)
+
+
+    def _position_for(self, offset):
+        # Converts a byte offset to the position (in percent of the
+        # duration) up to which the data before it can be played.
+
+        if self.seek_index is not None:
+            return self.seek_index.time_for(offset) / self.seek_index.duration * 100
+        return float(offset) / self.downloader.size * 100
+
+
+    def _range_for(self, position):
+        # Returns the byte range needed to start playing at ``position``.
+
+        if self.seek_index is not None:
+            return self.seek_index.range_for(self.seek_index.duration * position / 100)
+        offset = int(self.downloader.size * position / 100)
+        return offset, offset + 1
+
+
+    @property
+    def position(self):
+        """
+        The position of the playhead (in percent of the duration).
+        """
+
+        if not self.downloader or not self.downloader.size:
+            return 0
+        return self._position_for(self.downloader.playhead)
+
+
+    def seek(self, position):
+        """
+        Moves the playhead to ``position`` (in percent), so that the data
+        needed to play from there on is downloaded next. Until the data
+        needed to start playback is there, this is only remembered.
+        """
+
+        if not self.ready:
+            self._seek_position = position
+        elif self.downloader and self.downloader.size:
+            start, end = self._range_for(position)
+            self.downloader.seek(start)
+            for gap in self.downloader.missing(start, end):
+                self.downloader.prioritize(*gap)
+            self._progress_cb(self.downloader)
+
+
+    def is_available(self, position):
+        """
+        Returns whether the data needed to start playing at ``position`` (in
+        percent) has been downloaded already.
+        """
+
+        if not self.downloader or not self.downloader.size:
+            return False
+        return not self.downloader.missing(*self._range_for(position))
+
+
+    def buffered(self, position, duration=None):
+        """
+        Returns the number of seconds of media buffered ahead of ``position``
+        (in seconds) and the number of seconds that have to be so that
+        playing from there on doesn't stall before the end, given the media's
+        bitrate and the current download rate (see
+        ``download.required_buffer``).
+
+        ``duration`` (in seconds) is needed unless the container has an
+        index; returns ``None`` if it's missing or the size of the stream is
+        still unknown.
+        """
+
+        downloader = self.downloader
+        if downloader is None or not downloader.size:
+            return None
+        if self.seek_index is not None:
+            duration = self.seek_index.duration
+        if not duration:
+            return None
+
+        position = min(max(position, 0), duration)
+        offset = self._range_for(position * 100.0 / duration)[0]
+        end = offset + downloader.available(offset)
+        buffered = max(0, self._position_for(end) * duration / 100 - position)
+
+        remaining = sum(gap_end - gap_start for gap_start, gap_end
+                        in downloader.missing(end, downloader.size))
+        if not remaining:
+            return buffered, 0
+        if not downloader.rate:
+            return buffered, FALLBACK_BUFFER_SECONDS
+
+        bitrate = float(downloader.size) / duration
+        required = required_buffer(remaining, downloader.rate, bitrate) / bitrate
+        return buffered, max(required, MIN_BUFFER_SECONDS)
+
+
+    def load(self, uri, video_id, resolution, head=None, refresh_uri=None):
+        """
+        Sets up the buffer for ``uri``, the stream of ``video_id`` in
+        ``resolution``, and returns the path of the buffer file.
+
+        Whatever has been downloaded of that stream before (even in an
+        earlier session) is taken from the media cache, and only the rest is
+        downloaded. If ``uri`` turns out to have expired, ``refresh_uri`` is
+        called (from a download thread) to get a new one.
+
+        ``head`` may be the path of a file containing the first bytes of
+        ``uri``'s data (e.g., prefetched ones). These bytes are copied into
+        the buffer file as well, and the file is deleted.
+        """
 
         self.ready = False
-
-        self.src.set_property('location', uri)
-
-        tmp = tempfile.mktemp(dir='/tmp')
-        self.sink.set_property('location', tmp)
-        self.test_src.set_property('location', tmp)
-
-        return tmp
+        self.eos = False
+        self.seek_index = None
+        self._seek_position = None
+
+        if self.downloader is not None:
+            self.downloader.close()
+            self.save_state()
+
+        self.key = video_id, resolution
+        cached = self.media_cache.get(video_id, resolution)
+        if cached is None:
+            path, size, ranges = self.media_cache.path_for(video_id, resolution), None, ()
+        else:
+            path, size, ranges = cached
+
+        self.downloader = Downloader(uri, path, self.transport,
+                                     connections=self.connections,
+                                     adaptive=self.adaptive,
+                                     size=size, ranges=ranges,
+                                     refresh_url=refresh_uri,
+                                     on_progress=self._progress_cb)
+
+        if head is not None:
+            if not self.downloader.available(0):
+                with open(head, 'rb') as head_file:
+                    self.downloader.add_data(0, head_file.read())
+            os.remove(head)
+
+        return path
+
+
+    def save_state(self):
+        """
+        Records what has been downloaded of the current stream in the media
+        cache.
+        """
+
+        downloader = self.downloader
+        if downloader is None or downloader.size is None:
+            return
+        self.media_cache.set(self.key[0], self.key[1], downloader.size, downloader.downloaded())
+        self._state_saved = time.time()
 
 
     def flush(self):
@@ -140,14 +350,12 @@ class Buffer(gobject.GObject):
             raise BufferException, "'state' must be either 'STATE_NULL' or 'STATE_PLAYING', not '{0}'!".format(state)
 
         if state == STATE_NULL:
-            self.pipeline.set_state(gst.STATE_NULL)
-            if self.update_timeout:
-                gobject.source_remove(self.update_timeout)
-                self.update_timeout = None
+            if self.downloader is not None:
+                self.downloader.stop()
+                self.save_state()
             self.state = STATE_NULL
         elif state == STATE_PLAYING:
-            self.pipeline.set_state(gst.STATE_PLAYING)
-            if self.update_timeout:
-                gobject.source_remove(self.update_timeout)
-            self.update_timeout = gobject.timeout_add(100, self.update)
+            self.downloader.start()
             self.state = STATE_PLAYING
+            # (There might be nothing left to download, and thus no progress.)
+            self._progress_cb(self.downloader)
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import sqlite3
+import cPickle
+import threading
+from collections import OrderedDict
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key         TEXT PRIMARY KEY,
+    accessed    REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS fields (
+    key         TEXT NOT NULL,
+    name        TEXT NOT NULL,
+    value       TEXT NOT NULL,
+    expires     REAL NOT NULL,
+    PRIMARY KEY (key, name)
+);
+"""
+
+_MEDIA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media (
+    video_id    TEXT NOT NULL,
+    resolution  TEXT NOT NULL,
+    size        INTEGER NOT NULL,
+    ranges      TEXT NOT NULL,
+    complete    INTEGER NOT NULL,
+    accessed    REAL NOT NULL,
+    PRIMARY KEY (video_id, resolution)
+);
+"""
+
+
+def _connect(local, path, schema):
+    # sqlite3 connections must not be shared between threads.
+    try:
+        return local.db
+    except AttributeError:
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        db = sqlite3.connect(path, timeout=30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.executescript(schema)
+        local.db = db
+        return db
+
+def _encode_strings(value):
+    # ``json`` decodes all strings to ``unicode``; hand out what was stored.
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return map(_encode_strings, value)
+    if isinstance(value, dict):
+        return dict((_encode_strings(k), _encode_strings(v)) for k, v in value.iteritems())
+    return value
+
+
+class MetadataCache(object):
+    """
+    Persistent key/value cache for metadata, backed by a single SQLite file.
+
+    Every entry is a dictionary of fields; each field expires on its own
+    according to ``ttls`` (a dictionary mapping field names to seconds),
+    falling back to ``default_ttl`` for fields not listed there. Once there
+    are more than ``max_entries`` entries, the least recently used ones are
+    evicted.
+
+    Several threads and processes may use the same cache file at once.
+    Values have to be JSON-serializable; strings are handed out as UTF-8
+    encoded ``str`` objects.
+
+    The number of cache hits and misses is counted in ``hits`` and ``misses``.
+    """
+    def __init__(self, path, ttls=None, default_ttl=7*24*60*60, max_entries=5000):
+        self.path = path
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        return _connect(self._local, self.path, _SCHEMA)
+
+    def ttl_for(self, name):
+        return self.ttls.get(name, self.default_ttl)
+
+    def get(self, key, required=()):
+        """
+        Returns a ``(fields, expires)`` tuple for ``key`` where ``fields`` is
+        a dictionary of all fields that have not expired yet and ``expires``
+        the time when the first of them will expire.
+
+        Returns ``None`` (and counts a miss) if there are no fresh fields or
+        if any of the ``required`` fields is missing.
+        """
+        now = time.time()
+        with self._db as db:
+            rows = db.execute('SELECT name, value, expires FROM fields '
+                              'WHERE key = ? AND expires > ?', (key, now)).fetchall()
+            fields = dict((str(name), _encode_strings(json.loads(value)))
+                          for name, value, _ in rows)
+            if not fields or any(name not in fields for name in required):
+                self.misses += 1
+                return None
+            db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        self.hits += 1
+        return fields, min(expires for _, _, expires in rows)
+
+    def set(self, key, fields):
+        """
+        Stores the ``fields`` dictionary for ``key``, replacing all fields
+        previously stored for it.
+        """
+        now = time.time()
+        with self._db as db:
+            db.execute('DELETE FROM fields WHERE key = ?', (key,))
+            db.executemany('INSERT INTO fields VALUES (?, ?, ?, ?)', [
+                (key, name, json.dumps(value), now + self.ttl_for(name))
+                for name, value in fields.iteritems()
+            ])
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?)', (key, now))
+            self._evict(db, now)
+
+    def delete(self, key):
+        with self._db as db:
+            db.execute('DELETE FROM fields WHERE key = ?', (key,))
+            db.execute('DELETE FROM entries WHERE key = ?', (key,))
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def _evict(self, db, now):
+        db.execute('DELETE FROM fields WHERE expires <= ?', (now,))
+        db.execute('DELETE FROM entries WHERE key NOT IN (SELECT key FROM fields)')
+        overflow = len(self) - self.max_entries
+        if overflow > 0:
+            db.execute('DELETE FROM entries WHERE key IN ('
+                       'SELECT key FROM entries ORDER BY accessed LIMIT ?)', (overflow,))
+            db.execute('DELETE FROM fields WHERE key NOT IN (SELECT key FROM entries)')
+
+
+class MediaCache(object):
+    """
+    Persistent store for (partially) downloaded video streams, one file per
+    ``(video_id, resolution)`` in ``directory``.
+
+    Along with each file, the stream's size and the list of ``(start, end)``
+    byte ranges that have been downloaded completely are stored (in an
+    SQLite database in the same directory). Once the downloaded data of all
+    files exceeds ``quota`` bytes, the least recently used files are deleted.
+
+    The number of cache hits and misses is counted in ``hits`` and ``misses``.
+    """
+    def __init__(self, directory, quota=1024*1024*1024):
+        self.directory = directory
+        self.quota = quota
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+
+    @property
+    def _db(self):
+        return _connect(self._local, os.path.join(self.directory, 'media.sqlite'), _MEDIA_SCHEMA)
+
+    def path_for(self, video_id, resolution):
+        return os.path.join(self.directory, '{0}-{1}.media'.format(video_id, resolution))
+
+    def get(self, video_id, resolution):
+        """
+        Returns a ``(path, size, ranges)`` tuple for the stored stream or
+        ``None`` if nothing of it is stored.
+        """
+        with self._db as db:
+            row = db.execute('SELECT size, ranges FROM media WHERE video_id = ? AND resolution = ?',
+                             (video_id, resolution)).fetchone()
+            path = self.path_for(video_id, resolution)
+            if row is None or not os.path.exists(path):
+                self.misses += 1
+                return None
+            db.execute('UPDATE media SET accessed = ? WHERE video_id = ? AND resolution = ?',
+                       (time.time(), video_id, resolution))
+        self.hits += 1
+        size, ranges = row
+        return path, size, [tuple(r) for r in json.loads(ranges)]
+
+    def set(self, video_id, resolution, size, ranges):
+        """
+        Records that the ``ranges`` of the stream (which is ``size`` bytes
+        large) have been downloaded to ``path_for(video_id, resolution)``,
+        and evicts other streams if the quota is exceeded.
+        """
+        ranges = list(ranges)
+        complete = sum(end - start for start, end in ranges)
+        with self._db as db:
+            db.execute('INSERT OR REPLACE INTO media VALUES (?, ?, ?, ?, ?, ?)',
+                       (video_id, resolution, size, json.dumps(ranges), complete, time.time()))
+            self._evict(db, keep=(video_id, resolution))
+
+    def delete(self, video_id, resolution):
+        with self._db as db:
+            db.execute('DELETE FROM media WHERE video_id = ? AND resolution = ?',
+                       (video_id, resolution))
+        try:
+            os.remove(self.path_for(video_id, resolution))
+        except OSError:
+            pass
+
+    def usage(self):
+        """
+        Returns the number of bytes downloaded for all stored streams.
+        """
+        return self._db.execute('SELECT COALESCE(SUM(complete), 0) FROM media').fetchone()[0]
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM media').fetchone()[0]
+
+    def _evict(self, db, keep):
+        usage = db.execute('SELECT COALESCE(SUM(complete), 0) FROM media').fetchone()[0]
+        rows = db.execute('SELECT video_id, resolution, complete FROM media '
+                          'ORDER BY accessed').fetchall()
+        for video_id, resolution, complete in rows:
+            if usage <= self.quota:
+                break
+            if (video_id, resolution) == keep:
+                continue
+            db.execute('DELETE FROM media WHERE video_id = ? AND resolution = ?',
+                       (video_id, resolution))
+            try:
+                os.remove(self.path_for(video_id, resolution))
+            except OSError:
+                pass
+            usage -= complete
+
+
+class SearchCache(object):
+    """
+    In-memory LRU cache with a single ``ttl`` for all entries and at most
+    ``max_entries`` entries.
+
+    If ``path`` is given, the cache is loaded from that file on creation and
+    written back to it whenever it changes. Values must be picklable then.
+    """
+    def __init__(self, ttl=30*60, max_entries=100, path=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self._load()
+
+    def get(self, key):
+        """
+        Returns a ``(value, age)`` tuple for ``key`` or ``None`` if the key
+        is unknown or its entry has expired.
+        """
+        with self._lock:
+            try:
+                timestamp, value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            age = time.time() - timestamp
+            if age > self.ttl:
+                self.misses += 1
+                return None
+            # re-insert to mark the entry as most recently used
+            self._entries[key] = timestamp, value
+            self.hits += 1
+            return value, age
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = time.time(), value
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path is not None:
+                self._save()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self):
+        try:
+            with open(self.path, 'rb') as f:
+                self._entries = cPickle.load(f)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            # Broken cache files are simply ignored.
+            self._entries = OrderedDict()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'wb') as f:
+            cPickle.dump(self._entries, f, cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, self.path)
@@ -2,7 +2,13 @@ import os
 import re
 import tempfile
 import thread
-import gtk
+import threading
+import collections
+try:
+    import gtk
+except ImportError:
+    # (only ``Lock`` needs gtk; the rest of this module works without it)
+    gtk = None
 
 STATE_LOADING = 0
 STATE_NULL = 1
@@ -12,16 +18,52 @@ STATE_BUFFERING = 4
 DEFAULT_TEMPFILE_DIR = os.path.join('cream', 'youtube-player')
 
 
-_cleanup_regexes = (
-    (re.compile(r'(?P<amp>&)(?P<X>\w*[^;\w])'), lambda m: '&amp;'+m.group('X')),
-    (re.compile(r'<br/?>'), ''),
-    (re.compile(r'</?a.*?>'), '')
-)
-def cleanup_markup(s):
-    for pattern, replace in _cleanup_regexes:
-        s = pattern.sub(replace, s)
-    return s
+_PANGO_TAGS = ('b', 'big', 'i', 's', 'small', 'span', 'sub', 'sup', 'tt', 'u')
+
+_markup_token = re.compile(r"""
+    (?P<entity>&\w+;)
+  | (?P<amp>&)
+  | (?P<br><br/?>)
+  | (?P<link></?a.*?>)
+  | (?P<tag></?(?:%s)\b[^<>]*>)
+  | (?P<lt><)
+""" % '|'.join(_PANGO_TAGS), re.VERBOSE)
+
+_markup_replacements = {
+    'entity'    : None,     # keep
+    'amp'       : '&amp;',
+    'br'        : '',
+    'link'      : '',
+    'tag'       : None,     # keep
+    'lt'        : '&lt;',
+}
+
+def _replace_markup_token(match):
+    replacement = _markup_replacements[match.lastgroup]
+    if replacement is None:
+        return match.group()
+    return replacement
+
+#: Recently cleaned up strings, least recently used first
+_cleanup_cache = collections.OrderedDict()
+_cleanup_cache_lock = threading.Lock()
+_CLEANUP_CACHE_SIZE = 2000
 
+def cleanup_markup(s):
+    """
+    Makes ``s`` safe to be used in Pango markup: Removes line breaks and
+    links and escapes all ampersands and angle brackets that are not part
+    of an entity or a Pango tag.
+    """
+    with _cleanup_cache_lock:
+        try:
+            result = _cleanup_cache.pop(s)
+        except KeyError:
+            result = _markup_token.sub(_replace_markup_token, s)
+            if len(_cleanup_cache) >= _CLEANUP_CACHE_SIZE:
+                _cleanup_cache.popitem(last=False)
+        _cleanup_cache[s] = result
+        return result
 
 class Lock(object):
     def __init__(self, for_obj):
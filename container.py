@@ -0,0 +1,378 @@
+"""
+Just enough MP4 and FLV parsing to tell which parts of a partially
+downloaded video have to be there before it can be played, and where its
+keyframes are.
+"""
+import struct
+from bisect import bisect_right
+
+#: Number of bytes at the beginning of an MP4 file's media data required to
+#: start playback.
+MP4_MEDIA_DATA_BYTES = 32 * 1024
+
+_MP4_BOX_TYPES = frozenset(['ftyp', 'moov', 'mdat', 'free', 'skip', 'wide', 'pnot'])
+
+FLV_TAG_AUDIO = 8
+FLV_TAG_VIDEO = 9
+FLV_TAG_SCRIPT = 18
+_FLV_KEYFRAME = 1
+_FLV_CODEC_AVC = 7
+_FLV_AVC_SEQUENCE_HEADER = 0
+
+
+class ContainerError(Exception):
+    pass
+
+
+class NeedData(Exception):
+    """
+    Raised if the bytes from ``start`` to ``end`` are needed to go on, but
+    have not been downloaded yet.
+    """
+    def __init__(self, start, end):
+        Exception.__init__(self, start, end)
+        self.start = start
+        self.end = end
+
+
+class SeekIndex(object):
+    """
+    Maps times (in seconds) to the byte offsets of a video's keyframes and
+    back.
+
+    :param times: The keyframes' times, in ascending order.
+    :param offsets: The keyframes' byte offsets.
+    :param duration: The video's duration in seconds.
+    :param size: The file size in bytes.
+    """
+    def __init__(self, times, offsets, duration, size):
+        self.times = times
+        self.offsets = offsets
+        self.duration = duration
+        self.size = size
+
+    def __len__(self):
+        return len(self.times)
+
+    def _keyframe_at(self, time):
+        return max(0, bisect_right(self.times, time) - 1)
+
+    def offset_for(self, time):
+        """
+        Returns the byte offset of the last keyframe at or before ``time``.
+        """
+        return self.offsets[self._keyframe_at(time)]
+
+    def range_for(self, time):
+        """
+        Returns the ``(start, end)`` byte range needed to start playing at
+        ``time``: from the last keyframe at or before ``time`` to the next one.
+        """
+        index = self._keyframe_at(time)
+        if index + 1 < len(self.offsets):
+            return self.offsets[index], self.offsets[index + 1]
+        return self.offsets[index], self.size
+
+    def time_for(self, offset):
+        """
+        Returns the time up to which a video can be played if the data
+        before byte ``offset`` is available (as far as the keyframes tell).
+        """
+        if offset >= self.size:
+            return self.duration
+        index = bisect_right(self.offsets, offset) - 1
+        if index < 0:
+            return 0
+        return self.times[index]
+
+
+def _reader(read, size):
+    def _read(offset, length):
+        if offset + length > size:
+            # (No use waiting for data that will never be downloaded.)
+            raise ContainerError("Truncated file: {0} bytes needed at {1}, "
+                                 "but the file has {2}".format(length, offset, size))
+        data = read(offset, length)
+        if data is None:
+            raise NeedData(offset, offset + length)
+        return data
+    return _read
+
+def detect(header):
+    """
+    Returns ``'mp4'``, ``'flv'`` or ``None`` (unknown) for a file starting
+    with the (at least 8) bytes ``header``.
+    """
+    if header.startswith('FLV'):
+        return 'flv'
+    if header[4:8] in _MP4_BOX_TYPES:
+        return 'mp4'
+    return None
+
+def mp4_boxes(read, size, offset=0, end=None):
+    """
+    Yields ``(type, start, data_start, end)`` for all MP4 boxes between
+    ``offset`` and ``end`` (defaulting to ``size``), where ``data_start`` is
+    the offset of the box's contents.
+    """
+    read = _reader(read, size)
+    if end is None:
+        end = size
+    while offset + 8 <= end:
+        box_size, box_type = struct.unpack('>I4s', read(offset, 8))
+        header_size = 8
+        if box_size == 1:
+            box_size, = struct.unpack('>Q', read(offset + 8, 8))
+            header_size = 16
+        elif box_size == 0:
+            # extends to the end of the file
+            box_size = end - offset
+        if box_size < header_size:
+            raise ContainerError("Broken '{0}' box at {1}".format(box_type, offset))
+        yield box_type, offset, offset + header_size, offset + box_size
+        offset += box_size
+
+def startup_ranges(read, size):
+    """
+    Returns the list of ``(start, end)`` byte ranges that are needed to
+    start playing a file of ``size`` bytes from the beginning, using
+    ``read(offset, length)`` to look at the data downloaded so far (which
+    returns ``None`` if the bytes have not been downloaded yet).
+
+    Raises ``NeedData`` if that cannot be told without more data, and
+    ``ContainerError`` for unknown or broken files.
+    """
+    header = _reader(read, size)(0, min(size, 9))
+    kind = detect(header)
+    if kind == 'mp4':
+        return _mp4_startup_ranges(read, size)
+    elif kind == 'flv':
+        return _flv_startup_ranges(read, size)
+    raise ContainerError("Unknown container format")
+
+def _mp4_startup_ranges(read, size):
+    moov = mdat = None
+    for box_type, start, data_start, end in mp4_boxes(read, size):
+        # (If ``moov`` comes after ``mdat``, this skips right to the end of
+        # the file, so its tail is asked for early.)
+        if box_type == 'moov':
+            moov = start, end
+        elif box_type == 'mdat':
+            mdat = data_start, end
+        if moov is not None and mdat is not None:
+            break
+    else:
+        raise ContainerError("No 'moov' and 'mdat' boxes")
+    if moov[1] > size:
+        raise ContainerError("Truncated 'moov' box")
+    return [moov, (mdat[0], min(mdat[1], mdat[0] + MP4_MEDIA_DATA_BYTES, size))]
+
+def _flv_startup_ranges(read, size):
+    read = _reader(read, size)
+    _, _, flags, data_offset = struct.unpack('>3sBBI', read(0, 9))
+    has_video = flags & 1
+    # Skip the first ``PreviousTagSize`` (always 0).
+    offset = data_offset + 4
+    while offset + 11 <= size:
+        tag_type, data_size_high, data_size_low = struct.unpack('>BBH', read(offset, 4))
+        end = offset + 11 + (data_size_high << 16 | data_size_low) + 4
+        if tag_type == FLV_TAG_VIDEO and has_video:
+            # The first key frame (that is not just the AVC decoder
+            # configuration) is what we need to show something.
+            flags, packet_type = struct.unpack('>BB', read(offset + 11, 2))
+            if flags >> 4 == _FLV_KEYFRAME and not (
+                    flags & 0x0f == _FLV_CODEC_AVC and packet_type == _FLV_AVC_SEQUENCE_HEADER):
+                return [(0, min(end, size))]
+        elif tag_type == FLV_TAG_AUDIO and not has_video:
+            return [(0, min(end, size))]
+        offset = end
+    return [(0, size)]
+
+def seek_index(read, size):
+    """
+    Builds the ``SeekIndex`` of a file of ``size`` bytes from its MP4 sample
+    tables or its FLV ``onMetaData`` keyframe list (see ``startup_ranges``
+    for ``read``). Returns ``None`` if the file has no such information (or
+    a duration of 0, as e.g. fragmented MP4 files).
+
+    Raises ``NeedData`` if the ``moov`` box or the FLV metadata tag have not
+    been downloaded yet, and ``ContainerError`` for unknown or broken files.
+    """
+    kind = detect(_reader(read, size)(0, min(size, 9)))
+    try:
+        if kind == 'mp4':
+            index = _mp4_seek_index(read, size)
+        elif kind == 'flv':
+            index = _flv_seek_index(read, size)
+        else:
+            raise ContainerError("Unknown container format")
+    except (struct.error, IndexError, KeyError, ValueError), exc:
+        raise ContainerError("Broken {0} file: {1}".format(kind, exc))
+    if index is None or not index.duration:
+        # (Positions can't be mapped to times then.)
+        return None
+    return index
+
+def _string_reader(data):
+    return lambda offset, length: data[offset:offset + length]
+
+def _children(data, start=0, end=None):
+    return dict((box_type, (data_start, box_end)) for box_type, _, data_start, box_end
+                in mp4_boxes(_string_reader(data), len(data), start, end))
+
+def _mp4_seek_index(read, size):
+    for box_type, start, data_start, end in mp4_boxes(read, size):
+        if box_type == 'moov':
+            moov = _reader(read, size)(data_start, end - data_start)
+            break
+    else:
+        raise ContainerError("No 'moov' box")
+
+    tracks = {}
+    for box_type, _, data_start, end in mp4_boxes(_string_reader(moov), len(moov)):
+        if box_type != 'trak':
+            continue
+        mdia = _children(moov, *_children(moov, data_start, end)['mdia'])
+        hdlr_start, _ = mdia['hdlr']
+        handler = moov[hdlr_start + 8:hdlr_start + 12]
+        tracks.setdefault(handler, (moov, mdia))
+    # Seek by the video's keyframes; audio-only files have no others.
+    for handler in ('vide', 'soun'):
+        if handler in tracks:
+            return _mp4_track_index(size, *tracks[handler])
+    return None
+
+def _full_box(data, box):
+    # Returns the contents of a "full box" (skipping version and flags) and
+    # its version.
+    start, end = box
+    return data[start + 4:end], ord(data[start])
+
+def _mp4_track_index(size, data, mdia):
+    mdhd, version = _full_box(data, mdia['mdhd'])
+    if version == 1:
+        timescale, duration = struct.unpack('>IQ', mdhd[16:28])
+    else:
+        timescale, duration = struct.unpack('>II', mdhd[8:16])
+
+    stbl = _children(data, *_children(data, *mdia['minf'])['stbl'])
+
+    def table(name, row):
+        # Returns the rows of a sample table box as tuples.
+        contents, _ = _full_box(data, stbl[name])
+        count, = struct.unpack('>I', contents[:4])
+        format = '>' + row * count
+        values = struct.unpack(format, contents[4:4 + struct.calcsize(format)])
+        return [values[i:i + len(row)] for i in xrange(0, len(values), len(row))]
+
+    if 'stco' in stbl:
+        chunk_offsets = [offset for offset, in table('stco', 'I')]
+    else:
+        chunk_offsets = [offset for offset, in table('co64', 'Q')]
+    sample_to_chunk = table('stsc', 'III')
+    time_to_sample = table('stts', 'II')
+    # Without an 'stss' box, every sample is a keyframe.
+    sync_samples = set(number for number, in table('stss', 'I')) if 'stss' in stbl else None
+    stsz, _ = _full_box(data, stbl['stsz'])
+    sample_size, sample_count = struct.unpack('>II', stsz[:8])
+    if sample_size:
+        sample_sizes = [sample_size] * sample_count
+    else:
+        sample_sizes = struct.unpack('>{0}I'.format(sample_count), stsz[8:8 + 4 * sample_count])
+
+    def sample_times():
+        time = 0
+        for count, delta in time_to_sample:
+            for _ in xrange(count):
+                yield time
+                time += delta
+    times = sample_times()
+
+    keyframe_times = []
+    keyframe_offsets = []
+    sample = 0
+    for index, (first_chunk, samples_per_chunk, _) in enumerate(sample_to_chunk):
+        if index + 1 < len(sample_to_chunk):
+            last_chunk = sample_to_chunk[index + 1][0] - 1
+        else:
+            last_chunk = len(chunk_offsets)
+        for chunk in xrange(first_chunk, last_chunk + 1):
+            offset = chunk_offsets[chunk - 1]
+            for _ in xrange(min(samples_per_chunk, sample_count - sample)):
+                time = next(times)
+                # (sample numbers start at 1)
+                if sync_samples is None or sample + 1 in sync_samples:
+                    keyframe_times.append(float(time) / timescale)
+                    keyframe_offsets.append(offset)
+                offset += sample_sizes[sample]
+                sample += 1
+
+    if not keyframe_times:
+        return None
+    return SeekIndex(keyframe_times, keyframe_offsets, float(duration) / timescale, size)
+
+def _flv_seek_index(read, size):
+    read = _reader(read, size)
+    _, _, _, data_offset = struct.unpack('>3sBBI', read(0, 9))
+    offset = data_offset + 4
+    tag_type, data_size_high, data_size_low = struct.unpack('>BBH', read(offset, 4))
+    if tag_type != FLV_TAG_SCRIPT:
+        return None
+    data = read(offset + 11, data_size_high << 16 | data_size_low)
+    name, position = _amf0_value(data, 0)
+    if name != 'onMetaData':
+        return None
+    metadata, _ = _amf0_value(data, position)
+    keyframes = metadata.get('keyframes')
+    if not keyframes or not keyframes.get('times'):
+        return None
+    return SeekIndex(keyframes['times'], map(int, keyframes['filepositions']),
+                     metadata.get('duration') or keyframes['times'][-1], size)
+
+def _amf0_string(data, position, length_format='>H'):
+    length_size = struct.calcsize(length_format)
+    length, = struct.unpack(length_format, data[position:position + length_size])
+    position += length_size
+    return data[position:position + length], position + length
+
+def _amf0_properties(data, position):
+    properties = {}
+    while data[position:position + 3] != '\0\0\x09':
+        if position >= len(data):
+            raise ValueError("Unterminated AMF0 object")
+        name, position = _amf0_string(data, position)
+        properties[name], position = _amf0_value(data, position)
+    return properties, position + 3
+
+def _amf0_value(data, position):
+    """
+    Decodes the AMF0 value at ``position`` in ``data`` and returns it along
+    with the position right after it.
+    """
+    marker = ord(data[position])
+    position += 1
+    if marker == 0x00:      # number
+        return struct.unpack('>d', data[position:position + 8])[0], position + 8
+    elif marker == 0x01:    # boolean
+        return data[position] != '\0', position + 1
+    elif marker == 0x02:    # string
+        return _amf0_string(data, position)
+    elif marker == 0x03:    # object
+        return _amf0_properties(data, position)
+    elif marker in (0x05, 0x06):    # null, undefined
+        return None, position
+    elif marker == 0x08:    # ECMA array (the count is just a hint)
+        return _amf0_properties(data, position + 4)
+    elif marker == 0x0a:    # strict array
+        count, = struct.unpack('>I', data[position:position + 4])
+        position += 4
+        values = []
+        for _ in xrange(count):
+            value, position = _amf0_value(data, position)
+            values.append(value)
+        return values, position
+    elif marker == 0x0b:    # date
+        return struct.unpack('>d', data[position:position + 8])[0], position + 10
+    elif marker == 0x0c:    # long string
+        return _amf0_string(data, position, '>I')
+    raise ValueError("Unsupported AMF0 type {0:#x}".format(marker))
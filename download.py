@@ -0,0 +1,499 @@
+import os
+import re
+import math
+import time
+import httplib
+import threading
+
+from transport import HTTPError
+
+SEGMENT_SIZE = 512 * 1024
+BLOCK_SIZE = 64 * 1024
+#: Minimum factor by which an additional connection has to increase the
+#: throughput of an adaptive download to be kept.
+PROBE_GAIN = 1.15
+#: Number of times a failed request is retried before giving up, and the
+#: delay before the first retry (which doubles with each further one).
+RETRIES = 5
+RETRY_DELAY = 0.5
+#: Number of bytes downloaded between two progress notifications.
+PROGRESS_BYTES = 256 * 1024
+#: Minimum interval (in seconds) between two download rate samples, and
+#: the time constant the samples are smoothed with.
+RATE_INTERVAL = 0.5
+RATE_TIME_CONSTANT = 3.0
+#: Fraction of the measured download rate that is relied on when planning
+#: playback (the rate fluctuates).
+RATE_MARGIN = 0.8
+#: Status codes that mean that a stream URL has expired.
+_URL_EXPIRED = frozenset([403, 404, 410])
+
+_CONTENT_RANGE = re.compile(r'bytes (\d+)-(\d+)/(\d+)')
+
+
+class RangeMap(object):
+    """
+    A set of byte ranges, kept as a sorted list of non-overlapping
+    ``(start, end)`` tuples (``end`` being exclusive).
+
+        >>> ranges = RangeMap([(0, 10)])
+        >>> ranges.add(10, 20)
+        >>> ranges.add(30, 40)
+        >>> list(ranges)
+        [(0, 20), (30, 40)]
+        >>> ranges.missing(0, 50)
+        [(20, 30), (40, 50)]
+    """
+    def __init__(self, ranges=()):
+        self._ranges = []
+        for start, end in ranges:
+            self.add(start, end)
+
+    def __iter__(self):
+        return iter(self._ranges)
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __repr__(self):
+        return '<RangeMap {0!r}>'.format(self._ranges)
+
+    def add(self, start, end):
+        if start >= end:
+            return
+        ranges = []
+        for range_start, range_end in self._ranges:
+            if range_end < start or range_start > end:
+                ranges.append((range_start, range_end))
+            else:
+                # overlapping or adjacent, merge
+                start, end = min(start, range_start), max(end, range_end)
+        ranges.append((start, end))
+        ranges.sort()
+        self._ranges = ranges
+
+    def contains(self, start, end):
+        return not self.missing(start, end)
+
+    def contiguous_end(self, offset):
+        """
+        Returns the end of the range that contains ``offset``, or ``offset``
+        itself if no range contains it.
+        """
+        for start, end in self._ranges:
+            if start <= offset < end:
+                return end
+        return offset
+
+    def missing(self, start, end):
+        """
+        Returns the list of ``(start, end)`` gaps within ``start`` and ``end``.
+        """
+        gaps = []
+        for range_start, range_end in self._ranges:
+            if range_end <= start:
+                continue
+            if range_start >= end:
+                break
+            if range_start > start:
+                gaps.append((start, range_start))
+            start = max(start, range_end)
+        if start < end:
+            gaps.append((start, end))
+        return gaps
+
+    def total(self):
+        return sum(end - start for start, end in self._ranges)
+
+
+def required_buffer(remaining, rate, bitrate):
+    """
+    Returns how many bytes have to be buffered ahead of the playback
+    position so that playback at ``bitrate`` doesn't catch up with a
+    download at ``rate`` (both in bytes per second) before the ``remaining``
+    bytes of the stream (after the buffered ones) are in.
+
+    Downloading the ``remaining`` bytes takes ``remaining / rate`` seconds
+    and playing them ``remaining / bitrate`` seconds; the buffer has to make
+    up for the difference. Only ``RATE_MARGIN`` of ``rate`` is relied on.
+
+        >>> required_buffer(1000, 100, 80)
+        0
+        >>> required_buffer(1000, 50, 80)
+        1000
+    """
+
+    rate *= RATE_MARGIN
+    if not remaining or rate >= bitrate:
+        return 0
+    return int(math.ceil(remaining * (bitrate - rate) / rate))
+
+
+class Downloader(object):
+    """
+    Downloads ``url`` into the local file ``path`` using HTTP ``Range``
+    requests, one segment of ``segment_size`` bytes at a time.
+
+    The file is as large as the remote file from the beginning (sparse, where
+    supported); which parts of it have been downloaded already is tracked in
+    ``ranges`` (a ``RangeMap``). Missing segments are fetched starting at the
+    ``playhead`` (see ``seek``), continuing at the beginning of the file once
+    everything after the playhead is complete. Ranges passed to
+    ``prioritize`` are fetched before anything else.
+
+    Up to ``connections`` segments are fetched in parallel, each over its own
+    connection, which helps with servers that throttle each connection. If
+    ``adaptive`` is true, the download starts with a single connection and
+    adds further ones only as long as that increases the overall throughput
+    (which is available as ``throughput``, in bytes per second).
+
+    A download can be continued in a file that already contains some of the
+    data by passing the file's ``size`` and the list of ``ranges`` that have
+    been downloaded before.
+
+    Failed requests are retried (up to ``RETRIES`` times in a row, waiting
+    longer after each attempt), continuing where the previous one stopped.
+    If the server refuses the URL, ``refresh_url`` (if given) is called to
+    get a new one. If something goes wrong anyway, the download stops and
+    ``error`` is set.
+
+    ``on_progress(downloader)`` is called (from a download thread) whenever
+    another ``PROGRESS_BYTES`` have been downloaded, once the size is known
+    and when the download stops. The download rate, smoothed over the last
+    few seconds, is available as ``rate`` (in bytes per second) and the
+    estimated time left as ``eta`` (in seconds).
+    """
+    def __init__(self, url, path, transport, segment_size=SEGMENT_SIZE,
+                 connections=1, adaptive=False, size=None, ranges=(),
+                 refresh_url=None, on_progress=None):
+        self.url = url
+        self.path = path
+        self.transport = transport
+        self.segment_size = segment_size
+        self.max_connections = connections
+        self.adaptive = adaptive
+        self.connections = 1 if adaptive else connections
+        self.size = size
+        self.ranges = RangeMap(ranges)
+        self.playhead = 0
+        self.throughput = None
+        self.error = None
+        self.refresh_url = refresh_url
+        self.on_progress = on_progress
+        self.rate = None
+        self._rate_start = None
+        self._rate_bytes = 0
+        self._unreported = 0
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._closed = False
+        self._workers = 0
+        self._in_flight = set()
+        self._urgent = []
+        self._probing = adaptive
+        self._probe_base = None
+        self._window_start = None
+        self._window_bytes = 0
+        self._window_segments = 0
+        self._file = open(path, 'r+b' if os.path.exists(path) else 'w+b', 0)
+
+    @property
+    def complete(self):
+        return self.size is not None and self.ranges.contains(0, self.size)
+
+    @property
+    def running(self):
+        return self._workers > 0
+
+    @property
+    def eta(self):
+        """
+        The estimated number of seconds until the download is complete, or
+        ``None`` if that cannot be told yet.
+        """
+        with self._lock:
+            if self.size is None or not self.rate:
+                return None
+            return (self.size - self.ranges.total()) / self.rate
+
+    def start(self):
+        """
+        Starts (or resumes) downloading in the background.
+        """
+        with self._lock:
+            if self._closed:
+                return
+            self._stopped = False
+            self.error = None
+            self._wakeup.clear()
+            # (a pause is not a slow download)
+            self._rate_start = None
+            if self.size is None:
+                # Find out the size with a single request first.
+                self._spawn(1)
+            else:
+                self._spawn(self.connections)
+            self._reset_window()
+
+    def stop(self):
+        """
+        Stops downloading after the current block.
+        """
+        with self._lock:
+            self._stopped = True
+            self._wakeup.set()
+
+    def close(self):
+        """
+        Stops downloading and closes the file (once all download threads
+        have finished writing to it).
+        """
+        with self._lock:
+            self._stopped = self._closed = True
+            self._wakeup.set()
+            if not self._workers:
+                self._file.close()
+
+    def seek(self, offset):
+        """
+        Moves the playhead to ``offset``: the bytes after it are downloaded next.
+        """
+        self.playhead = offset
+
+    def available(self, offset):
+        """
+        Returns the number of bytes at and after ``offset`` that have been
+        downloaded without interruption.
+        """
+        with self._lock:
+            return self.ranges.contiguous_end(offset) - offset
+
+    def downloaded(self):
+        """
+        Returns the list of ``(start, end)`` ranges downloaded so far.
+        """
+        with self._lock:
+            return list(self.ranges)
+
+    def missing(self, start, end):
+        """
+        Returns the list of ``(start, end)`` ranges between ``start`` and
+        ``end`` that have not been downloaded yet.
+        """
+        with self._lock:
+            return self.ranges.missing(start, end)
+
+    def read(self, offset, length):
+        """
+        Returns the ``length`` bytes at ``offset``, or ``None`` if they have
+        not been downloaded (completely) yet.
+        """
+        with self._lock:
+            if not self.ranges.contains(offset, offset + length):
+                return None
+            self._file.seek(offset)
+            return self._file.read(length)
+
+    def prioritize(self, start, end):
+        """
+        Makes the bytes from ``start`` to ``end`` be downloaded before
+        anything else (but after other ranges that have been prioritized
+        before).
+        """
+        with self._lock:
+            if (start, end) not in self._urgent:
+                self._urgent.append((start, end))
+
+    def add_data(self, offset, data):
+        """
+        Writes ``data`` (obtained from somewhere else) to ``offset``.
+        """
+        self._write(offset, data)
+
+    def _spawn(self, workers):
+        # (called with ``_lock`` held)
+        if self._stopped:
+            return
+        while self._workers < workers:
+            self._workers += 1
+            thread = threading.Thread(target=self._run)
+            thread.daemon = True
+            thread.start()
+
+    def _run(self):
+        failures = 0
+        try:
+            while True:
+                with self._lock:
+                    if self._stopped or self._workers > self.connections:
+                        segment = None
+                    else:
+                        segment = self._next_segment()
+                    if segment is None:
+                        self._exit()
+                        break
+                    self._in_flight.add(segment)
+                try:
+                    fetched = self._fetch(*segment)
+                except (IOError, httplib.HTTPException), exc:
+                    failures += 1
+                    if failures > RETRIES:
+                        raise
+                    self._recover(exc, failures)
+                else:
+                    failures = 0
+                    with self._lock:
+                        self._segment_done(fetched)
+                finally:
+                    with self._lock:
+                        self._in_flight.discard(segment)
+        except Exception, exc:
+            with self._lock:
+                self.error = exc
+                self._stopped = True
+                self._exit()
+        self._notify()
+
+    def _recover(self, exc, failures):
+        if isinstance(exc, HTTPError) and exc.code in _URL_EXPIRED:
+            if self.refresh_url is None:
+                raise exc
+            self.url = self.refresh_url()
+        else:
+            # Probably a network problem; wait a bit (unless stopped).
+            self._wakeup.wait(RETRY_DELAY * 2 ** (failures - 1))
+
+    def _exit(self):
+        # (called with ``_lock`` held)
+        self._workers -= 1
+        if self._closed and not self._workers:
+            self._file.close()
+
+    def _next_segment(self):
+        # (called with ``_lock`` held)
+        if self.size is None:
+            # The first response tells us the file size.
+            if self._in_flight:
+                return None
+            start = self.ranges.contiguous_end(self.playhead)
+            return start, start + self.segment_size
+        pending = RangeMap(self.ranges)
+        for start, end in self._in_flight:
+            pending.add(start, end)
+        self._urgent = [(start, end) for start, end in self._urgent
+                        if not self.ranges.contains(start, min(end, self.size))]
+        gaps = []
+        for start, end in self._urgent:
+            gaps.extend(pending.missing(start, min(end, self.size)))
+        playhead = min(self.playhead, self.size)
+        gaps += pending.missing(playhead, self.size) + pending.missing(0, playhead)
+        if not gaps:
+            return None
+        start, end = gaps[0]
+        return start, min(end, start + self.segment_size)
+
+    def _reset_window(self):
+        # (called with ``_lock`` held)
+        self._window_start = time.time()
+        self._window_bytes = 0
+        self._window_segments = 0
+
+    def _segment_done(self, fetched):
+        # (called with ``_lock`` held)
+        self._window_bytes += fetched
+        self._window_segments += 1
+        if self._window_segments < self.connections:
+            self._spawn(self.connections)
+            return
+        # Each connection finished a segment (on average), time to measure.
+        throughput = self._window_bytes / max(time.time() - self._window_start, 1e-6)
+        if self._probe_base is not None and throughput < self._probe_base * PROBE_GAIN:
+            # The connection we added last did not help (much), so it's not
+            # the per-connection throttling that limits us. Step back.
+            self._probing = False
+            self.connections -= 1
+        self._probe_base = None
+        self.throughput = throughput
+        if self._probing and self.connections < self.max_connections:
+            self._probe_base = throughput
+            self.connections += 1
+        self._spawn(self.connections)
+        self._reset_window()
+
+    def _fetch(self, start, end):
+        response = self.transport.open(self.url, {
+            'Range'             : 'bytes={0}-{1}'.format(start, end - 1),
+            'Accept-Encoding'   : 'identity'
+        })
+        if response.status != 206:
+            # The server ignores ``Range`` and sends everything.
+            start = 0
+        if self.size is None:
+            self._set_size(response)
+            end = min(end, self.size) if response.status == 206 else self.size
+        position = start
+        try:
+            while position < end and not self._stopped:
+                data = response.read(min(BLOCK_SIZE, end - position))
+                if not data:
+                    raise IOError("Connection closed after {0} of {1} bytes".format(
+                        position - start, end - start))
+                self._write(position, data)
+                self._count(len(data))
+                position += len(data)
+        except Exception:
+            # (whatever has been written is kept)
+            response.close()
+            raise
+        if response.status == 206 and position == end:
+            response.read()
+        else:
+            response.close()
+        return position - start
+
+    def _set_size(self, response):
+        match = _CONTENT_RANGE.match(response.headers.get('content-range', ''))
+        if match is not None:
+            size = int(match.group(3))
+        else:
+            size = int(response.headers['content-length'])
+        with self._lock:
+            self.size = size
+            self._file.truncate(size)
+        self._notify()
+
+    def _write(self, offset, data):
+        with self._lock:
+            self._file.seek(offset)
+            self._file.write(data)
+            self.ranges.add(offset, offset + len(data))
+
+    def _count(self, size):
+        # Updates the download rate and notifies about progress.
+        with self._lock:
+            now = time.time()
+            if self._rate_start is None:
+                self._rate_start = now
+                self._rate_bytes = 0
+            self._rate_bytes += size
+            elapsed = now - self._rate_start
+            if elapsed >= RATE_INTERVAL and elapsed > 0:
+                sample = self._rate_bytes / elapsed
+                if self.rate is None:
+                    self.rate = sample
+                else:
+                    # exponential moving average, independent of the interval
+                    weight = 1 - math.exp(-elapsed / RATE_TIME_CONSTANT)
+                    self.rate += weight * (sample - self.rate)
+                self._rate_start = now
+                self._rate_bytes = 0
+            self._unreported += size
+            if self._unreported < PROGRESS_BYTES:
+                return
+            self._unreported = 0
+        self._notify()
+
+    def _notify(self):
+        if self.on_progress is not None:
+            self.on_progress(self)
@@ -0,0 +1,98 @@
+import re
+import collections
+from lxml.etree import iterparse
+
+ATOM_NS     = '{http://www.w3.org/2005/Atom}'
+MEDIA_NS    = '{http://search.yahoo.com/mrss/}'
+YOUTUBE_NS  = '{http://gdata.youtube.com/schemas/2007}'
+GDATA_NS    = '{http://schemas.google.com/g/2005}'
+
+#: ``(attribute name, element path, XML attribute or None for the text)``
+#: of all values extracted from a feed entry.
+ENTRY_FIELDS = (
+    ('video_id',        ATOM_NS + 'id',                                         None),
+    ('_raw_datetime',   ATOM_NS + 'published',                                  None),
+    ('title',           MEDIA_NS + 'group/' + MEDIA_NS + 'title',               None),
+    ('description',     MEDIA_NS + 'group/' + MEDIA_NS + 'description',         None),
+    ('category',        MEDIA_NS + 'group/' + MEDIA_NS + 'category',            None),
+    ('_raw_tags',       MEDIA_NS + 'group/' + MEDIA_NS + 'keywords',            None),
+    ('uri',             MEDIA_NS + 'group/' + MEDIA_NS + 'player',              'url'),
+    ('_raw_duration',   MEDIA_NS + 'group/' + YOUTUBE_NS + 'duration',          'seconds'),
+    ('_raw_view_count', YOUTUBE_NS + 'statistics',                              'viewCount'),
+    ('_raw_rating',     GDATA_NS + 'rating',                                    'average'),
+)
+
+_PREFIXES = {
+    ATOM_NS     : '',
+    MEDIA_NS    : 'media:',
+    YOUTUBE_NS  : 'yt:',
+    GDATA_NS    : 'gd:'
+}
+
+
+def _to_str(value):
+    # gdata hands out UTF-8 encoded ``str`` objects, so we do too.
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+def parse_entry(entry):
+    """
+    Extracts the raw values listed in ``ENTRY_FIELDS`` from the ``<entry>``
+    element ``entry`` and returns them as a dictionary. Values that are
+    missing in the entry are ``None``.
+    """
+    fields = {}
+    for name, path, attribute in ENTRY_FIELDS:
+        element = entry.find(path)
+        if element is None:
+            value = None
+        elif attribute is None:
+            value = element.text
+        else:
+            value = element.get(attribute)
+        fields[name] = _to_str(value)
+    if fields['video_id'] is not None:
+        # 'http://gdata.youtube.com/feeds/api/videos/<id>' (API version 1) or
+        # 'tag:youtube.com,2008:video:<id>' (API version 2)
+        fields['video_id'] = fields['video_id'].split('/')[-1].split(':')[-1]
+    return fields
+
+def fields_projection(entry_fields=ENTRY_FIELDS):
+    """
+    Returns the value for the ``fields`` query parameter that makes YouTube
+    send only the elements of each entry needed for ``entry_fields`` (see
+    ``ENTRY_FIELDS``), like ``'entry(id,media:group(media:title))'``.
+    """
+    def _prefixed(tag):
+        namespace, name = tag[1:].split('}')
+        return _PREFIXES['{' + namespace + '}'] + name
+
+    elements = collections.OrderedDict()
+    for _, path, _ in entry_fields:
+        # (namespaces contain slashes, so don't just split at '/')
+        tags = map(_prefixed, re.findall(r'{[^}]*}[^/]+', path))
+        if len(tags) == 2:
+            elements.setdefault(tags[0], []).append(tags[1])
+        else:
+            elements.setdefault(tags[0], [])
+    return 'entry({0})'.format(','.join(
+        '{0}({1})'.format(name, ','.join(children)) if children else name
+        for name, children in elements.iteritems()
+    ))
+
+def parse_feed(source):
+    """
+    Parses the feed read from ``source`` (a file name or a file-like object)
+    incrementally and yields the dictionary returned by ``parse_entry`` for
+    each entry as soon as it has been read completely.
+
+    (Unlike ``gdata.youtube.service``, which builds the feed's complete
+    object tree before handing out the first entry.)
+    """
+    for _, entry in iterparse(source, events=('end',), tag=ATOM_NS + 'entry'):
+        yield parse_entry(entry)
+        # Throw away everything parsed so far to keep memory usage flat.
+        entry.clear()
+        while entry.getprevious() is not None:
+            del entry.getparent()[0]
@@ -0,0 +1,141 @@
+import os
+import time
+import threading
+
+from common import NamedTempfile
+from workers import WorkerPool
+from youtube import YouTubeError
+
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_MAX_BYTES = 400 * 1024
+
+
+class Prefetcher(object):
+    """
+    Speculatively requests the video info of videos that are likely to be
+    played next and downloads the first ``max_bytes`` of their stream, so
+    that playback can start from local data.
+
+    :param resolution_for:
+        Function that returns the resolution that would be played for a
+        given ``Video`` (whose info has been requested already).
+    :param max_concurrent:
+        Maximum number of prefetches that run at the same time.
+    :param max_bytes:
+        Number of bytes downloaded from the beginning of each stream.
+    :param rate_cb:
+        Function that is called (from a worker thread) with the rate (in
+        bytes per second) each stream's beginning has been downloaded at.
+
+    Whether ``take`` found prefetched data is counted in ``hits`` and
+    ``misses``.
+    """
+    def __init__(self, resolution_for, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 max_bytes=DEFAULT_MAX_BYTES, rate_cb=None):
+        self.resolution_for = resolution_for
+        self.max_bytes = max_bytes
+        self.rate_cb = rate_cb
+        self.hits = 0
+        self.misses = 0
+        self._pool = WorkerPool(max_concurrent)
+        self._pending = {}
+        self._heads = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, video):
+        """
+        Schedules a prefetch for ``video`` unless one is pending already.
+        """
+        with self._lock:
+            if video.video_id in self._pending:
+                return
+            self._pending[video.video_id] = self._pool.submit(self._prefetch, video)
+
+    def cancel_pending(self):
+        """
+        Cancels all prefetches that have not been started yet.
+        """
+        with self._lock:
+            for job in self._pending.itervalues():
+                job.cancel()
+            self._pending.clear()
+
+    def clear(self):
+        """
+        Cancels all pending prefetches and deletes the data prefetched so far
+        that hasn't been taken.
+        """
+        self.cancel_pending()
+        with self._lock:
+            heads = self._heads.values()
+            self._heads.clear()
+        for head in heads:
+            try:
+                os.remove(head)
+            except OSError:
+                pass
+
+    def take(self, video_id, resolution):
+        """
+        Returns the path of a file containing the first bytes of the stream
+        of ``video_id`` in ``resolution``, or ``None`` if no such data has
+        been prefetched. The file is handed over to the caller, who has to
+        delete it.
+        """
+        with self._lock:
+            head = self._heads.pop((video_id, resolution), None)
+        if head is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return head
+
+    def _prefetch(self, video):
+        try:
+            video.request_video_info()
+            resolution = self.resolution_for(video)
+            key = video.video_id, resolution
+            with self._lock:
+                if key in self._heads:
+                    return
+            head = self._download_head(video, resolution)
+            with self._lock:
+                self._heads[key] = head
+        except (YouTubeError, IOError):
+            # It's only speculation.
+            pass
+        finally:
+            with self._lock:
+                self._pending.pop(video.video_id, None)
+
+    def _download_head(self, video, resolution):
+        tempfile = NamedTempfile('{0}-{1}-head'.format(video.video_id, resolution))
+        started = time.time()
+        response = video.transport.open(video.stream_urls[resolution], {
+            'Range' : 'bytes=0-{0}'.format(self.max_bytes - 1),
+            'Accept-Encoding' : 'identity'
+        })
+        try:
+            with tempfile:
+                tempfile.file.truncate(0)
+                remaining = self.max_bytes
+                while remaining:
+                    data = response.read(min(remaining, 64 * 1024))
+                    if not data:
+                        break
+                    tempfile.file.write(data)
+                    remaining -= len(data)
+            if response.status == 206 or remaining:
+                # Nothing left to read, reuse the connection.
+                response.read()
+        except Exception:
+            os.remove(tempfile.name)
+            raise
+        finally:
+            # (The server ignored the ``Range`` header and keeps sending, or
+            # reading failed; does nothing if the connection has been reused.)
+            response.close()
+        elapsed = time.time() - started
+        if self.rate_cb is not None and elapsed > 0:
+            self.rate_cb((self.max_bytes - remaining) / elapsed)
+        return tempfile.name
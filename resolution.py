@@ -0,0 +1,155 @@
+import logging
+import threading
+import collections
+
+from download import required_buffer
+from workers import WorkerPool
+
+#: Value of the ``preferred_resolution`` option that selects the resolution
+#: by the available bandwidth
+AUTO = 'auto'
+#: Number of recent download rate samples the throughput is estimated from
+THROUGHPUT_SAMPLES = 5
+#: Maximum number of seconds playback may have to wait for the buffer
+#: (see ``download.required_buffer``) for a stream to count as sustainable
+MAX_STARTUP_DELAY = 5
+#: Number of stalls while playing a stream after which a lower resolution is
+#: chosen
+STALL_LIMIT = 2
+DEFAULT_MAX_CONCURRENT = 4
+
+log = logging.getLogger(__name__)
+
+
+class ResolutionSelector(object):
+    """
+    Chooses the resolution a video is played in from the throughput of
+    recent downloads and the bitrates of the video's streams.
+
+    The bitrates are estimated from the sizes of the streams, which are
+    found out with concurrent ``HEAD`` requests, and the video's duration.
+    The highest resolution whose stream can be played without rebuffering
+    (after waiting at most ``MAX_STARTUP_DELAY`` seconds) is chosen.
+
+    If playing a stream stalls ``STALL_LIMIT`` times, no stream with that
+    bitrate or a higher one is chosen anymore until ``reset`` is called.
+
+    :param transport:
+        The ``HTTPTransport`` to send the ``HEAD`` requests with.
+    :param max_concurrent:
+        Maximum number of ``HEAD`` requests sent at the same time.
+    """
+    def __init__(self, transport, max_concurrent=DEFAULT_MAX_CONCURRENT):
+        self.transport = transport
+        self._pool = WorkerPool(max_concurrent)
+        self._samples = collections.deque(maxlen=THROUGHPUT_SAMPLES)
+        self._sizes = {}
+        self._stalls = None, 0
+        self._max_bitrate = None
+        self._lock = threading.Lock()
+
+    def add_sample(self, rate):
+        """
+        Records that a download has just run at ``rate`` bytes per second.
+        """
+        if rate:
+            with self._lock:
+                self._samples.append(rate)
+
+    @property
+    def throughput(self):
+        """
+        The estimated throughput in bytes per second (or ``None`` if there
+        are no samples yet): the harmonic mean of the recent samples, which
+        is dominated by the slow ones.
+        """
+        with self._lock:
+            if not self._samples:
+                return None
+            return len(self._samples) / sum(1.0 / rate for rate in self._samples)
+
+    def reset(self):
+        """
+        Forgets about the stalls so far.
+        """
+        with self._lock:
+            self._stalls = None, 0
+            self._max_bitrate = None
+
+    def stream_sizes(self, video):
+        """
+        Returns a dictionary mapping the resolutions of ``video`` (whose info
+        has been requested already) to the sizes of their streams, leaving
+        out those whose size couldn't be found out.
+        """
+        with self._lock:
+            sizes = dict((resolution, self._sizes[video.video_id, resolution])
+                         for resolution in video.stream_urls
+                         if (video.video_id, resolution) in self._sizes)
+        unknown = [resolution for resolution in video.stream_urls
+                   if resolution not in sizes]
+
+        def get_size(resolution):
+            response = self.transport.open(video.stream_urls[resolution], method='HEAD')
+            return int(response.headers['content-length'])
+
+        for resolution, size, exc_info in self._pool.imap_unordered(get_size, unknown):
+            if exc_info is not None:
+                log.info('%s: size of the %s stream unknown (%s)',
+                         video.video_id, resolution, exc_info[1])
+                continue
+            sizes[resolution] = size
+            with self._lock:
+                self._sizes[video.video_id, resolution] = size
+        return sizes
+
+    def choose(self, video):
+        """
+        Returns the resolution ``video`` (whose info has been requested
+        already) should be played in, or ``None`` if there's nothing to base
+        that on yet.
+        """
+        throughput = self.throughput
+        if throughput is None or not video.duration:
+            log.info('%s: no resolution chosen (throughput %s, duration %s)',
+                     video.video_id, throughput, video.duration)
+            return None
+
+        bitrates = dict((resolution, float(size) / video.duration)
+                        for resolution, size in self.stream_sizes(video).iteritems())
+        if not bitrates:
+            return None
+        max_bitrate = self._max_bitrate
+
+        choice = None
+        for resolution, bitrate in sorted(bitrates.iteritems(), key=lambda item: -item[1]):
+            choice = resolution
+            if max_bitrate is not None and bitrate >= max_bitrate:
+                continue
+            delay = required_buffer(bitrate * video.duration, throughput, bitrate) / bitrate
+            if delay <= MAX_STARTUP_DELAY:
+                break
+
+        log.info('%s: chose %s (throughput %.0f B/s from %d samples, bitrate limit %s, '
+                 'stream bitrates %s B/s)', video.video_id, choice, throughput,
+                 len(self._samples), max_bitrate,
+                 ', '.join('%s: %.0f' % item for item in sorted(bitrates.iteritems())))
+        return choice
+
+    def stalled(self, video, resolution):
+        """
+        Records that playing ``video`` in ``resolution`` stalled, and
+        returns whether a lower resolution should be chosen now.
+        """
+        with self._lock:
+            key = video.video_id, resolution
+            stream, stalls = self._stalls
+            stalls = stalls + 1 if stream == key else 1
+            self._stalls = key, stalls
+            if stalls < STALL_LIMIT or key not in self._sizes or not video.duration:
+                return False
+            self._max_bitrate = float(self._sizes[key]) / video.duration
+            self._stalls = None, 0
+        log.info('%s: stalled %d times in %s, stepping down below %.0f B/s',
+                 video.video_id, stalls, resolution, self._max_bitrate)
+        return True
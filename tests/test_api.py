@@ -1,4 +1,6 @@
+import time
 import datetime
+import threading
 import unittest
 import youtube
 
@@ -6,6 +8,53 @@ YOUTUBE_DEVELOPER_KEY = 'AI39si5ABc6YvX1MST8Q7O-uxN7Ra1ly-KKryqH7pc0fb8MrMvvVzvq
 
 BUCKET = dict()
 
+
+class _Video(object):
+    """
+    Stands in for a ``youtube.Video`` whose info takes ``delay`` seconds to
+    request.
+    """
+    lock = threading.Lock()
+    running = 0
+    max_running = 0
+
+    def __init__(self, delay, error=None):
+        self.delay = delay
+        self.error = error
+
+    def request_video_info(self):
+        with self.lock:
+            _Video.running += 1
+            _Video.max_running = max(_Video.max_running, _Video.running)
+        time.sleep(self.delay)
+        with self.lock:
+            _Video.running -= 1
+        if self.error is not None:
+            raise self.error
+
+    def download_thumbnail(self):
+        pass
+
+
+class FetchVideoInfosTestCase(unittest.TestCase):
+    def setUp(self):
+        self.api = youtube.API(YOUTUBE_DEVELOPER_KEY, max_workers=4)
+        _Video.max_running = 0
+
+    def test_completion_order(self):
+        error = youtube.YouTubeError('unavailable')
+        videos = [_Video(.3), _Video(.1), _Video(.2, error)]
+        results = list(self.api.fetch_video_infos(videos))
+        self.assertEqual(results, [(videos[1], None), (videos[2], error), (videos[0], None)])
+        self.assertEqual(_Video.max_running, 3)
+
+    def test_max_workers(self):
+        videos = [_Video(.05) for _ in xrange(6)]
+        results = list(self.api.fetch_video_infos(videos, max_workers=2))
+        self.assertEqual(sorted(video for video, _ in results), sorted(videos))
+        self.assertEqual(_Video.max_running, 2)
+
+
 class YouTubePlayerTestCase(unittest.TestCase):
     def setUp(self):
         self.api = youtube.API(YOUTUBE_DEVELOPER_KEY)
@@ -0,0 +1,104 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import cache
+
+class MetadataCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = cache.MetadataCache(os.path.join(self.dir, 'cache.sqlite'),
+                                         ttls={'short': .1}, max_entries=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_ttl(self):
+        self.cache.set('a', {'short': ['x'], 'long': ['y']})
+        fields, expires = self.cache.get('a', required=('short',))
+        self.assertEqual(fields, {'short': ['x'], 'long': ['y']})
+        self.assert_(expires <= time.time() + .1)
+        time.sleep(.15)
+        self.assertEqual(self.cache.get('a', required=('short',)), None)
+        self.assertEqual(self.cache.get('a')[0], {'long': ['y']})
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 1))
+
+    def test_lru_eviction(self):
+        self.cache.set('a', {'x': 1})
+        self.cache.set('b', {'x': 2})
+        self.cache.get('a')
+        self.cache.set('c', {'x': 3})
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get('b'), None)
+        self.assert_(self.cache.get('a'))
+
+    def test_shared_file(self):
+        self.cache.set('a', {'x': 1})
+        other = cache.MetadataCache(self.cache.path)
+        self.assertEqual(other.get('a')[0], {'x': 1})
+
+class MediaCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cache = cache.MediaCache(self.dir, quota=250)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _store(self, video_id, ranges):
+        with open(self.cache.path_for(video_id, '720p'), 'wb') as f:
+            f.truncate(1000)
+        self.cache.set(video_id, '720p', 1000, ranges)
+
+    def test_get(self):
+        self.assertEqual(self.cache.get('a', '720p'), None)
+        self._store('a', [(0, 100), (500, 600)])
+        self.assertEqual(self.cache.get('a', '720p'),
+                         (self.cache.path_for('a', '720p'), 1000, [(0, 100), (500, 600)]))
+        self.assertEqual(self.cache.get('a', '360p'), None)
+        self.assertEqual(self.cache.usage(), 200)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_quota(self):
+        self._store('a', [(0, 100)])
+        self._store('b', [(0, 100)])
+        self.cache.get('a', '720p')
+        time.sleep(.01)
+        self._store('c', [(0, 100)])
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get('b', '720p'), None)
+        self.assertFalse(os.path.exists(self.cache.path_for('b', '720p')))
+        # The stream being downloaded is never evicted.
+        self.cache.set('c', '720p', 1000, [(0, 1000)])
+        self.assertEqual(len(self.cache), 1)
+        self.assert_(self.cache.get('c', '720p'))
+
+    def test_delete(self):
+        self._store('a', [(0, 100)])
+        self.cache.delete('a', '720p')
+        self.assertEqual(self.cache.get('a', '720p'), None)
+        self.assertFalse(os.path.exists(self.cache.path_for('a', '720p')))
+
+
+class SearchCacheTestCase(unittest.TestCase):
+    def test_ttl_and_size(self):
+        search_cache = cache.SearchCache(ttl=.1, max_entries=2)
+        search_cache.set('a', [1])
+        search_cache.set('b', [2])
+        self.assertEqual(search_cache.get('a')[0], [1])
+        search_cache.set('c', [3])
+        self.assertEqual(search_cache.get('b'), None)
+        time.sleep(.15)
+        self.assertEqual(search_cache.get('a'), None)
+
+    def test_persistence(self):
+        path = os.path.join(tempfile.mkdtemp(), 'search-cache')
+        try:
+            cache.SearchCache(path=path).set(('foo', 'relevance', ()), [1, 2])
+            self.assertEqual(cache.SearchCache(path=path).get(('foo', 'relevance', ()))[0], [1, 2])
+        finally:
+            shutil.rmtree(os.path.dirname(path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import struct
+import unittest
+import container
+from download import RangeMap
+
+
+def box(box_type, data):
+    return struct.pack('>I4s', len(data) + 8, box_type) + data
+
+def full_box(box_type, data, version=0):
+    return box(box_type, chr(version) + '\0\0\0' + data)
+
+def table(box_type, rows, format='I'):
+    return full_box(box_type, struct.pack('>I', len(rows)) + ''.join(
+        struct.pack('>' + format * len(row), *row) for row in rows))
+
+def mp4_track(handler, timescale, sample_sizes, chunks, deltas, keyframes=None):
+    stbl = [
+        table('stts', deltas, 'I'),
+        table('stsc', chunks, 'I'),
+        table('stco', [(offset,) for offset in chunk_offsets(chunks, sample_sizes)]),
+        full_box('stsz', struct.pack('>II', 0, len(sample_sizes)) +
+                         struct.pack('>%dI' % len(sample_sizes), *sample_sizes)),
+    ]
+    if keyframes is not None:
+        stbl.append(table('stss', [(number,) for number in keyframes]))
+    duration = sum(count * delta for count, delta in deltas)
+    return box('trak', box('mdia',
+        full_box('mdhd', struct.pack('>IIII', 0, 0, timescale, duration) + '\0' * 4) +
+        full_box('hdlr', '\0' * 4 + handler + '\0' * 12) +
+        box('minf', box('stbl', ''.join(stbl)))))
+
+MDAT_START = 1000
+
+def chunk_offsets(chunks, sample_sizes):
+    # (chunks: ``(first_chunk, samples_per_chunk, 1)`` rows, with just one
+    # chunk per row here)
+    offsets = []
+    offset = MDAT_START
+    sample = 0
+    for _, samples, _ in chunks:
+        offsets.append(offset)
+        offset += sum(sample_sizes[sample:sample + samples])
+        sample += samples
+    return offsets
+
+def amf0(value):
+    if isinstance(value, str):
+        return '\x02' + struct.pack('>H', len(value)) + value
+    if isinstance(value, list):
+        return '\x0a' + struct.pack('>I', len(value)) + ''.join(map(amf0, value))
+    if isinstance(value, dict):
+        return '\x08' + struct.pack('>I', len(value)) + ''.join(
+            struct.pack('>H', len(name)) + name + amf0(item)
+            for name, item in value.iteritems()) + '\0\0\x09'
+    return '\x00' + struct.pack('>d', value)
+
+def flv_tag(tag_type, data):
+    header = struct.pack('>BBH', tag_type, len(data) >> 16, len(data) & 0xffff)
+    return header + '\0' * 7 + data + struct.pack('>I', len(data) + 11)
+
+def flv(*tags):
+    return 'FLV\x01\x05' + struct.pack('>I', 9) + '\0\0\0\0' + ''.join(tags)
+
+
+class _File(object):
+    def __init__(self, data, ranges=None):
+        self.data = data
+        self.ranges = RangeMap(ranges or [(0, len(data))])
+
+    def read(self, offset, length):
+        if not self.ranges.contains(offset, offset + length):
+            return None
+        return self.data[offset:offset + length]
+
+
+class MP4TestCase(unittest.TestCase):
+    def test_moov_first(self):
+        moov = box('moov', 'x' * 100)
+        data = box('ftyp', 'isom') + moov + box('mdat', 'm' * 100000)
+        ranges = container.startup_ranges(_File(data).read, len(data))
+        self.assertEqual(ranges, [
+            (12, 12 + len(moov)),
+            (20 + len(moov), 20 + len(moov) + container.MP4_MEDIA_DATA_BYTES)
+        ])
+
+    def test_moov_last(self):
+        data = box('ftyp', 'isom') + box('mdat', 'm' * 100000) + box('moov', 'x' * 100)
+        moov_start = len(data) - 108
+        # Only the beginning has been downloaded, so we need the tail.
+        partial = _File(data, [(0, 50000)])
+        try:
+            container.startup_ranges(partial.read, len(data))
+        except container.NeedData, exc:
+            self.assertEqual((exc.start, exc.end), (moov_start, moov_start + 8))
+        else:
+            self.fail('NeedData not raised')
+
+        partial.ranges.add(moov_start, len(data))
+        ranges = container.startup_ranges(partial.read, len(data))
+        self.assertEqual(ranges[0], (moov_start, len(data)))
+        self.assertEqual(ranges[1], (20, 20 + container.MP4_MEDIA_DATA_BYTES))
+
+    def test_truncated(self):
+        data = box('ftyp', 'isom') + box('mdat', 'm' * 1000) + box('moov', 'x' * 100)
+        # The 'moov' box (or its header) is cut off; it never comes.
+        for size in (len(data) - 50, len(data) - 104):
+            self.assertRaises(container.ContainerError,
+                              container.startup_ranges, _File(data[:size]).read, size)
+        self.assertRaises(container.ContainerError,
+                          container.startup_ranges, _File('\0\0').read, 2)
+
+    def test_unknown(self):
+        data = '\x1aE\xdf\xa3' + '\0' * 100
+        self.assertRaises(container.ContainerError,
+                          container.startup_ranges, _File(data).read, len(data))
+
+
+class FLVTestCase(unittest.TestCase):
+    def test_first_keyframe(self):
+        metadata = flv_tag(18, 'onMetaData')
+        sequence_header = flv_tag(9, '\x17\x00' + 'c' * 20)
+        audio = flv_tag(8, '\xaf\x01' + 'a' * 20)
+        keyframe = flv_tag(9, '\x17\x01' + 'k' * 100)
+        data = flv(metadata, sequence_header, audio, keyframe, flv_tag(9, '\x27\x01' + 'i' * 100))
+        end = data.index(keyframe) + len(keyframe)
+        self.assertEqual(container.startup_ranges(_File(data).read, len(data)), [(0, end)])
+
+    def test_need_data(self):
+        data = flv(flv_tag(18, 'onMetaData'), flv_tag(9, '\x17\x01' + 'k' * 100))
+        partial = _File(data, [(0, 20)])
+        self.assertRaises(container.NeedData, container.startup_ranges, partial.read, len(data))
+
+    def test_truncated(self):
+        data = flv(flv_tag(18, 'onMetaData'), flv_tag(9, '\x17\x01' + 'k' * 100))
+        keyframe_start = data.index('\x17\x01') - 11
+        # Only the first bytes of the keyframe's tag header are there.
+        size = keyframe_start + 12
+        self.assertRaises(container.ContainerError,
+                          container.startup_ranges, _File(data[:size]).read, size)
+
+class SeekIndexTestCase(unittest.TestCase):
+    def test_mp4(self):
+        # 8 video samples of 100 bytes in 4 chunks, keyframes 1 and 5, at
+        # 25 fps; and an audio track that must be ignored.
+        video = mp4_track('vide', 25, [100] * 8, [(1, 2, 1), (2, 2, 1), (3, 2, 1), (4, 2, 1)],
+                          [(8, 1)], keyframes=[1, 5])
+        audio = mp4_track('soun', 100, [10] * 2, [(1, 2, 1)], [(2, 50)])
+        moov = box('moov', video + audio)
+        header = box('ftyp', 'isom') + moov
+        data = header + box('mdat', '\0' * (MDAT_START - len(header) - 8 + 800))
+        index = container.seek_index(_File(data).read, len(data))
+        self.assertEqual(index.times, [0.0, 4 / 25.0])
+        self.assertEqual(index.offsets, [MDAT_START, MDAT_START + 400])
+        self.assertEqual(index.duration, 8 / 25.0)
+        self.assertEqual(index.offset_for(0.1), MDAT_START)
+        self.assertEqual(index.offset_for(0.2), MDAT_START + 400)
+        self.assertEqual(index.range_for(0.1), (MDAT_START, MDAT_START + 400))
+        self.assertEqual(index.range_for(0.3), (MDAT_START + 400, len(data)))
+        self.assertEqual(index.time_for(MDAT_START + 500), 4 / 25.0)
+        self.assertEqual(index.time_for(len(data)), index.duration)
+
+        partial = _File(data, [(0, 20)])
+        self.assertRaises(container.NeedData, container.seek_index, partial.read, len(data))
+
+    def test_mp4_without_duration(self):
+        # (e.g. fragmented files, whose samples are in 'moof' boxes)
+        video = mp4_track('vide', 25, [100] * 2, [(1, 2, 1)], [(2, 0)], keyframes=[1])
+        header = box('ftyp', 'isom') + box('moov', video)
+        data = header + box('mdat', '\0' * (MDAT_START - len(header) - 8 + 200))
+        self.assertEqual(container.seek_index(_File(data).read, len(data)), None)
+
+    def test_flv(self):
+        metadata = amf0('onMetaData') + amf0({
+            'duration'  : 10.0,
+            'keyframes' : {'times': [0.0, 5.0], 'filepositions': [13.0, 5000.0]}
+        })
+        data = flv(flv_tag(18, metadata), flv_tag(9, '\x17\x01' + 'k' * 100))
+        index = container.seek_index(_File(data).read, len(data))
+        self.assertEqual(index.offset_for(6), 5000)
+        self.assertEqual(index.duration, 10.0)
+
+    def test_flv_without_keyframes(self):
+        data = flv(flv_tag(18, amf0('onMetaData') + amf0({'duration': 10.0})))
+        self.assertEqual(container.seek_index(_File(data).read, len(data)), None)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,266 @@
+import os
+import re
+import time
+import tempfile
+import threading
+import unittest
+import SocketServer
+import BaseHTTPServer
+import download
+import transport
+
+DATA = ''.join(chr(i % 251) for i in xrange(100000))
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    ranges = []
+    failures = []
+
+    def do_GET(self):
+        if self.path == '/expired':
+            self.send_error(403)
+            return
+        match = re.match(r'bytes=(\d+)-(\d+)', self.headers.get('Range', ''))
+        if match is None:
+            start, end = 0, len(DATA)
+            self.send_response(200)
+        else:
+            start, end = int(match.group(1)), min(int(match.group(2)) + 1, len(DATA))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, len(DATA)))
+        self.ranges.append((start, end))
+        self.send_header('Content-Length', str(end - start))
+        self.end_headers()
+        if self.failures and self.failures[0] == len(self.ranges):
+            # Drop the connection halfway through.
+            self.failures.pop(0)
+            self.wfile.write(DATA[start:(start + end) / 2])
+            self.close_connection = 1
+            return
+        self.wfile.write(DATA[start:end])
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # (clients dropping idle keep-alive connections)
+        pass
+
+
+def wait_for(downloader, timeout=10):
+    deadline = time.time() + timeout
+    while downloader.running and time.time() < deadline:
+        time.sleep(0.01)
+
+
+class RangeMapTestCase(unittest.TestCase):
+    def test_add(self):
+        ranges = download.RangeMap([(10, 20), (30, 40)])
+        ranges.add(20, 25)
+        self.assertEqual(list(ranges), [(10, 25), (30, 40)])
+        ranges.add(0, 35)
+        self.assertEqual(list(ranges), [(0, 40)])
+        ranges.add(50, 50)
+        self.assertEqual(list(ranges), [(0, 40)])
+        self.assertEqual(ranges.total(), 40)
+
+    def test_missing(self):
+        ranges = download.RangeMap([(10, 20), (30, 40)])
+        self.assertEqual(ranges.missing(0, 50), [(0, 10), (20, 30), (40, 50)])
+        self.assertEqual(ranges.missing(15, 35), [(20, 30)])
+        self.assertEqual(ranges.missing(12, 18), [])
+        self.assertTrue(ranges.contains(30, 40))
+        self.assertFalse(ranges.contains(15, 25))
+
+    def test_contiguous_end(self):
+        ranges = download.RangeMap([(10, 20)])
+        self.assertEqual(ranges.contiguous_end(15), 20)
+        self.assertEqual(ranges.contiguous_end(20), 20)
+        self.assertEqual(ranges.contiguous_end(5), 5)
+
+
+class RequiredBufferTestCase(unittest.TestCase):
+    def test_fast_enough(self):
+        self.assertEqual(download.required_buffer(10000, 2000, 1000), 0)
+        self.assertEqual(download.required_buffer(0, 100, 1000), 0)
+
+    def test_slow(self):
+        # 800 bytes per second (after the margin), i.e., the remaining 8000
+        # bytes take 10 s to download but only 8 s to play.
+        rate = 800 / download.RATE_MARGIN
+        self.assertEqual(download.required_buffer(8000, rate, 1000), 2000)
+
+
+class DownloaderTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.url = 'http://127.0.0.1:%d/video' % self.server.server_port
+        self.path = tempfile.mktemp()
+        self.transport = transport.HTTPTransport()
+        del _Handler.ranges[:]
+        del _Handler.failures[:]
+        self.retry_delay, download.RETRY_DELAY = download.RETRY_DELAY, 0.01
+
+    def tearDown(self):
+        # (closes the keep-alive connections)
+        self.transport = None
+        self.server.shutdown()
+        self.server.server_close()
+        download.RETRY_DELAY = self.retry_delay
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _read(self):
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_download(self):
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000)
+        downloader.start()
+        wait_for(downloader)
+        self.assertTrue(downloader.complete)
+        self.assertEqual(downloader.size, len(DATA))
+        self.assertEqual(self._read(), DATA)
+        self.assertEqual(len(_Handler.ranges), 4)
+
+    def test_playhead(self):
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000)
+        downloader.seek(50000)
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(self._read(), DATA)
+        self.assertEqual(_Handler.ranges[:3],
+                         [(50000, 80000), (80000, 100000), (0, 30000)])
+        self.assertEqual(downloader.available(50000), 50000)
+
+    def test_head(self):
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000)
+        downloader.add_data(0, DATA[:40000])
+        self.assertEqual(downloader.available(0), 40000)
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(self._read(), DATA)
+        self.assertEqual(_Handler.ranges[0], (40000, 70000))
+
+    def test_continue(self):
+        with open(self.path, 'wb') as f:
+            f.write(DATA[:50000])
+            f.truncate(len(DATA))
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000, size=len(DATA),
+                                         ranges=[(0, 50000)])
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(self._read(), DATA)
+        self.assertEqual(_Handler.ranges, [(50000, 80000), (80000, 100000)])
+        self.assertEqual(downloader.downloaded(), [(0, len(DATA))])
+
+    def test_prioritize(self):
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000)
+        downloader.prioritize(90000, 100000)
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(_Handler.ranges[:3], [(0, 30000), (90000, 100000), (30000, 60000)])
+        self.assertEqual(downloader.read(95000, 10), DATA[95000:95010])
+        self.assertEqual(downloader.missing(0, len(DATA)), [])
+
+    def test_connections(self):
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=10000, connections=3)
+        downloader.seek(30000)
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(self._read(), DATA)
+        self.assertEqual(len(_Handler.ranges), 10)
+        self.assertEqual(_Handler.ranges[0], (30000, 40000))
+        self.assertTrue(downloader.throughput > 0)
+
+    def test_adaptive(self):
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=10000, connections=3,
+                                         adaptive=True)
+        self.assertEqual(downloader.connections, 1)
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(self._read(), DATA)
+        self.assertTrue(1 <= downloader.connections <= 3)
+
+    def test_retry(self):
+        _Handler.failures[:] = [2, 3]
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000)
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(downloader.error, None)
+        self.assertEqual(self._read(), DATA)
+        self.assertEqual(_Handler.ranges[1:4], [(30000, 60000), (45000, 75000), (60000, 90000)])
+
+    def test_give_up(self):
+        _Handler.failures[:] = range(2, 2 + download.RETRIES + 1)
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000)
+        downloader.start()
+        wait_for(downloader)
+        self.assertTrue(isinstance(downloader.error, IOError))
+        self.assertFalse(downloader.complete)
+        # Starting again continues where it stopped.
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(self._read(), DATA)
+
+    def test_refresh_url(self):
+        expired_url = self.url.replace('/video', '/expired')
+        downloader = download.Downloader(expired_url, self.path, self.transport,
+                                         refresh_url=lambda: self.url)
+        downloader.start()
+        wait_for(downloader)
+        self.assertEqual(downloader.url, self.url)
+        self.assertEqual(self._read(), DATA)
+
+    def test_progress(self):
+        progress_bytes, download.PROGRESS_BYTES = download.PROGRESS_BYTES, 10000
+        rate_interval, download.RATE_INTERVAL = download.RATE_INTERVAL, 0
+        try:
+            notifications = []
+            downloader = download.Downloader(
+                self.url, self.path, self.transport, segment_size=30000,
+                on_progress=lambda d: notifications.append(d.available(0)))
+            self.assertEqual(downloader.eta, None)
+            downloader.start()
+            wait_for(downloader)
+            # (the last notification comes right after the thread finished)
+            time.sleep(.1)
+        finally:
+            download.PROGRESS_BYTES = progress_bytes
+            download.RATE_INTERVAL = rate_interval
+        # size known, after each (30000 byte) segment, and finished
+        self.assertEqual(len(notifications), 6)
+        self.assertEqual(notifications[-1], len(DATA))
+        self.assertTrue(downloader.rate > 0)
+        self.assertEqual(downloader.eta, 0)
+
+    def test_stop(self):
+        downloader = download.Downloader(self.url, self.path, self.transport,
+                                         segment_size=30000)
+        downloader.stop()
+        downloader.start()
+        downloader.stop()
+        wait_for(downloader)
+        self.assertFalse(downloader.complete)
+        downloader.start()
+        wait_for(downloader)
+        self.assertTrue(downloader.complete)
+        downloader.close()
+
+if __name__ == '__main__':
+    unittest.main()
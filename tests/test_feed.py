@@ -0,0 +1,65 @@
+import unittest
+import StringIO
+import feed
+
+FEED = """<?xml version='1.0' encoding='UTF-8'?>
+<feed xmlns='http://www.w3.org/2005/Atom' xmlns:media='http://search.yahoo.com/mrss/'
+      xmlns:yt='http://gdata.youtube.com/schemas/2007' xmlns:gd='http://schemas.google.com/g/2005'>
+  <title>YouTube Videos</title>
+  <entry>
+    <id>http://gdata.youtube.com/feeds/api/videos/abcdefghijk</id>
+    <published>2010-05-22T04:18:49.000Z</published>
+    <media:group>
+      <media:title type='plain'>Caf\xc3\xa9 &amp; more</media:title>
+      <media:description type='plain'>Some description</media:description>
+      <media:category label='Music'>Music</media:category>
+      <media:keywords>foo bar, baz</media:keywords>
+      <media:player url='http://www.youtube.com/watch?v=abcdefghijk'/>
+      <yt:duration seconds='42'/>
+    </media:group>
+    <gd:rating average='4.5' max='5' min='1' numRaters='10'/>
+    <yt:statistics favoriteCount='1' viewCount='1337'/>
+  </entry>
+  <entry>
+    <id>http://gdata.youtube.com/feeds/api/videos/kjihgfedcba</id>
+    <published>2010-05-23T04:18:49.000Z</published>
+    <media:group>
+      <media:title type='plain'>Second</media:title>
+      <yt:duration seconds='1'/>
+    </media:group>
+  </entry>
+</feed>"""
+
+class FeedParserTestCase(unittest.TestCase):
+    def test_parse_feed(self):
+        first, second = feed.parse_feed(StringIO.StringIO(FEED))
+        self.assertEqual(first, {
+            'video_id'          : 'abcdefghijk',
+            '_raw_datetime'     : '2010-05-22T04:18:49.000Z',
+            'title'             : 'Caf\xc3\xa9 & more',
+            'description'       : 'Some description',
+            'category'          : 'Music',
+            '_raw_tags'         : 'foo bar, baz',
+            'uri'               : 'http://www.youtube.com/watch?v=abcdefghijk',
+            '_raw_duration'     : '42',
+            '_raw_view_count'   : '1337',
+            '_raw_rating'       : '4.5'
+        })
+        self.assertEqual(second['video_id'], 'kjihgfedcba')
+        self.assertEqual(second['description'], None)
+        self.assertEqual(second['_raw_view_count'], None)
+
+    def test_fields_projection(self):
+        self.assertEqual(feed.fields_projection(), 'entry(id,published,'
+            'media:group(media:title,media:description,media:category,'
+                        'media:keywords,media:player,yt:duration),'
+            'yt:statistics,gd:rating)')
+
+    def test_version_2_ids(self):
+        entry, = feed.parse_feed(StringIO.StringIO(
+            "<feed xmlns='http://www.w3.org/2005/Atom'><entry>"
+            "<id>tag:youtube.com,2008:video:abcdefghijk</id></entry></feed>"))
+        self.assertEqual(entry['video_id'], 'abcdefghijk')
+
+if __name__ == '__main__':
+    unittest.main()
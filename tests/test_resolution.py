@@ -0,0 +1,93 @@
+import threading
+import unittest
+import SocketServer
+import BaseHTTPServer
+import resolution
+import transport
+
+# (stream sizes of a 100 second video)
+SIZES = {'/hd': 5000000, '/sd': 1000000, '/low': 300000}
+
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # (HTTP/1.0: closes the connection after each response)
+    requests = []
+
+    def do_HEAD(self):
+        self.requests.append(self.path)
+        if self.path not in SIZES:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(SIZES[self.path]))
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class _Video(object):
+    def __init__(self, stream_urls, duration=100):
+        self.video_id = 'video'
+        self.duration = duration
+        self.stream_urls = stream_urls
+
+
+class ResolutionSelectorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever).start()
+        url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.video = _Video({'720p': url + '/hd', '360p': url + '/sd',
+                             'FLV1': url + '/low', '1080p': url + '/missing'})
+        self.selector = resolution.ResolutionSelector(transport.HTTPTransport())
+        del _Handler.requests[:]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_stream_sizes(self):
+        sizes = self.selector.stream_sizes(self.video)
+        self.assertEqual(sizes, {'720p': 5000000, '360p': 1000000, 'FLV1': 300000})
+        self.assertEqual(len(_Handler.requests), 4)
+        # Known sizes are remembered.
+        self.selector.stream_sizes(self.video)
+        self.assertEqual(_Handler.requests[4:], ['/missing'])
+
+    def test_throughput(self):
+        self.assertEqual(self.selector.throughput, None)
+        self.selector.add_sample(100)
+        self.selector.add_sample(None)
+        self.selector.add_sample(300)
+        self.assertEqual(self.selector.throughput, 150)
+
+    def test_choose(self):
+        self.assertEqual(self.selector.choose(self.video), None)
+        # 10000 bytes per second are needed for 360p, 50000 for 720p.
+        self.selector.add_sample(20000)
+        self.assertEqual(self.selector.choose(self.video), '360p')
+
+    def test_fast(self):
+        self.selector.add_sample(1000000)
+        self.assertEqual(self.selector.choose(self.video), '720p')
+
+    def test_slow(self):
+        self.selector.add_sample(100)
+        self.assertEqual(self.selector.choose(self.video), 'FLV1')
+
+    def test_stalled(self):
+        self.selector.add_sample(1000000)
+        self.selector.choose(self.video)
+        self.assertFalse(self.selector.stalled(self.video, '720p'))
+        self.assertTrue(self.selector.stalled(self.video, '720p'))
+        self.assertEqual(self.selector.choose(self.video), '360p')
+        self.selector.reset()
+        self.assertEqual(self.selector.choose(self.video), '720p')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,89 @@
+import gzip
+import httplib
+import threading
+import unittest
+import StringIO
+import BaseHTTPServer
+import transport
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = set()
+
+    def do_GET(self):
+        self.connections.add(self.client_address)
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/hello')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if self.path == '/missing':
+            self.send_error(404)
+            return
+        if self.path == '/truncated':
+            self.send_response(200)
+            self.send_header('Content-Length', '100')
+            self.end_headers()
+            self.wfile.write('hello')
+            self.close_connection = 1
+            return
+        body = 'hello world'
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            buf = StringIO.StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='w') as f:
+                f.write(body)
+            body = buf.getvalue()
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPTransportTestCase(unittest.TestCase):
+    def setUp(self):
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), _Handler)
+        threading.Thread(target=self.server.serve_forever).start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.server_port
+        _Handler.connections.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_keep_alive(self):
+        http = transport.HTTPTransport(base_url=self.base_url)
+        for _ in xrange(5):
+            self.assertEqual(http.get('http://www.youtube.com/hello'), 'hello world')
+        self.assertEqual(len(_Handler.connections), 1)
+
+    def test_no_gzip(self):
+        http = transport.HTTPTransport(gzip=False, base_url=self.base_url)
+        self.assertEqual(http.get('http://www.youtube.com/hello'), 'hello world')
+
+    def test_streaming_read(self):
+        http = transport.HTTPTransport(base_url=self.base_url)
+        response = http.open('http://www.youtube.com/hello')
+        chunks = iter(lambda: response.read(3), '')
+        self.assertEqual(''.join(chunks), 'hello world')
+        self.assertEqual(http.get('http://www.youtube.com/hello'), 'hello world')
+        self.assertEqual(len(_Handler.connections), 1)
+
+    def test_redirect_and_errors(self):
+        http = transport.HTTPTransport(base_url=self.base_url)
+        self.assertEqual(http.get('http://www.youtube.com/redirect'), 'hello world')
+        self.assertRaises(transport.HTTPError, http.get, 'http://www.youtube.com/missing')
+        self.assertEqual(http.get('http://www.youtube.com/hello'), 'hello world')
+
+    def test_truncated(self):
+        http = transport.HTTPTransport(pool_size=1, base_url=self.base_url)
+        self.assertRaises(httplib.IncompleteRead, http.get, 'http://www.youtube.com/truncated')
+        # The connection's slot has been given back.
+        self.assertEqual(http.get('http://www.youtube.com/hello'), 'hello world')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -19,5 +19,32 @@ class UtilsTestCase(unittest.TestCase):
         del tmpfile3
         self.assert_(not os.path.exists('/tmp/cream/youtube-player-tests/some-file-that-will-be-automatically-deleted'))
 
+    def test_cleanup_markup(self):
+        for raw, expected in (
+            ('Tom & Jerry',                 'Tom &amp; Jerry'),
+            ('&amp; &foo;',                 '&amp; &foo;'),
+            ('line<br>break<br/>',          'linebreak'),
+            ('<a href="http://x">link</a>', 'link'),
+            ('<b>bold</b> <i>italic</i>',   '<b>bold</b> <i>italic</i>'),
+            # invalid markup in the input is escaped
+            ('a && b &',                    'a &amp;&amp; b &amp;'),
+            ('I <3 <div>',                  'I &lt;3 &lt;div>'),
+        ):
+            self.assertEqual(common.cleanup_markup(raw), expected)
+
+    def test_cleanup_markup_cache(self):
+        common._cleanup_cache.clear()
+        size = common._CLEANUP_CACHE_SIZE
+        for i in xrange(size):
+            common.cleanup_markup('title %d' % i)
+        # A hit makes an entry the most recently used one ...
+        common.cleanup_markup('title 0')
+        common.cleanup_markup('title %d' % size)
+        # ... so only the least recently used entry is evicted.
+        self.assertEqual(len(common._cleanup_cache), size)
+        self.assertTrue('title 0' in common._cleanup_cache)
+        self.assertFalse('title 1' in common._cleanup_cache)
+        self.assertEqual(common._cleanup_cache.keys()[-1], 'title %d' % size)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,116 @@
+import time
+import threading
+import unittest
+import workers
+
+class WorkerPoolTestCase(unittest.TestCase):
+    def test_imap_unordered(self):
+        pool = workers.WorkerPool(max_workers=3)
+        def _sleep(t):
+            time.sleep(t)
+            return t
+        results = list(pool.imap_unordered(_sleep, [.3, .1, .2]))
+        self.assertEqual([r[1] for r in results], [.1, .2, .3])
+        self.assert_(len(pool._workers) <= 3)
+
+    def test_max_pending(self):
+        pool = workers.WorkerPool(max_workers=4)
+        running = []
+        lock = threading.Lock()
+        def _run(item):
+            with lock:
+                running.append(item)
+                count = len(running)
+            time.sleep(.05)
+            with lock:
+                running.remove(item)
+            return count
+        results = list(pool.imap_unordered(_run, range(6), max_pending=2))
+        self.assertEqual(sorted(item for item, _, _ in results), range(6))
+        self.assertTrue(max(count for _, count, _ in results) <= 2)
+
+    def test_exceptions(self):
+        pool = workers.WorkerPool(max_workers=2)
+        job = pool.submit(lambda: 1/0)
+        self.assertRaises(ZeroDivisionError, job.wait)
+        (item, result, exc_info), = pool.imap_unordered(lambda x: 1/x, [0])
+        self.assertEqual(exc_info[0], ZeroDivisionError)
+
+    def test_done_callback(self):
+        pool = workers.WorkerPool(max_workers=1)
+        results = []
+        job = pool.submit(time.sleep, .1)
+        job.add_done_callback(lambda job: results.append(job))
+        job.wait()
+        # (the callbacks run right after the job is done, in its worker)
+        pool.submit(lambda: None).wait()
+        self.assertEqual(results, [job])
+        job.add_done_callback(lambda job: results.append(job))
+        self.assertEqual(results, [job, job])
+
+    def test_failing_done_callback(self):
+        pool = workers.WorkerPool(max_workers=1)
+        waited = []
+        def _fail(job):
+            waited.append(job.wait())
+            raise ValueError()
+        release = threading.Event()
+        def _job():
+            # (so that the callback is added before the job is done)
+            release.wait()
+            return 42
+        job = pool.submit(_job)
+        job.add_done_callback(_fail)
+        workers.log.disabled = True
+        try:
+            release.set()
+            self.assertEqual(job.wait(1), 42)
+            # The worker is still there.
+            self.assertEqual(pool.submit(lambda: 23).wait(1), 23)
+        finally:
+            workers.log.disabled = False
+        self.assertEqual(waited, [42])
+
+    def test_cancel(self):
+        pool = workers.WorkerPool(max_workers=1)
+        release = threading.Event()
+        blocker = pool.submit(release.wait)
+        called = []
+        results = []
+        job = pool.submit(lambda: called.append(1))
+        job.add_done_callback(lambda job: results.append(job))
+        job.cancel()
+        release.set()
+        self.assertRaises(workers.Cancelled, job.wait, 1)
+        self.assertTrue(job.done())
+        # Neither the job function nor its done callbacks are called.
+        job.add_done_callback(lambda job: results.append(job))
+        self.assertEqual(called, [])
+        self.assertEqual(results, [])
+        # Cancelling a job that has been run already has no effect.
+        blocker.cancel()
+        self.assertTrue(blocker.wait(1))
+
+class SingleFlightTestCase(unittest.TestCase):
+    def test_coalescing(self):
+        single_flight = workers.SingleFlight()
+        calls = []
+        def _fetch(result):
+            calls.append(result)
+            time.sleep(.1)
+            if result is None:
+                raise ValueError()
+            return result
+
+        pool = workers.WorkerPool(max_workers=5)
+        jobs = [pool.submit(single_flight.call, 'key', _fetch, 42) for _ in xrange(5)]
+        self.assertEqual([job.wait() for job in jobs], [42]*5)
+        self.assertEqual(calls, [42])
+
+        jobs = [pool.submit(single_flight.call, 'key', _fetch, None) for _ in xrange(5)]
+        for job in jobs:
+            self.assertRaises(ValueError, job.wait)
+        self.assertEqual(calls, [42, None])
+
+if __name__ == '__main__':
+    unittest.main()
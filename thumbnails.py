@@ -0,0 +1,75 @@
+import threading
+from collections import OrderedDict
+
+import gobject
+import gtk
+
+from common import NamedTempfile
+from workers import SingleFlight
+
+
+class ThumbnailCache(object):
+    """
+    Hands out video thumbnails as ``gtk.gdk.Pixbuf`` objects of ``size`` x
+    ``size`` pixels.
+
+    Thumbnails are decoded from memory right at that size, and the scaled
+    icons are stored in the tempfile directory, so showing the thumbnail of
+    a video again needs neither a download nor any scaling. The last
+    ``max_pixbufs`` pixbufs are kept in memory and shared by everyone asking
+    for the same video's thumbnail.
+    """
+    def __init__(self, size, max_pixbufs=500):
+        self.size = size
+        self.max_pixbufs = max_pixbufs
+        self._pixbufs = OrderedDict()
+        self._lock = threading.Lock()
+        self._single_flight = SingleFlight()
+
+    def get(self, video):
+        """
+        Returns the thumbnail of ``video`` or ``None`` if it has none.
+        Blocks while the thumbnail has to be downloaded.
+
+        (``request_video_info`` has to be called before calling this method)
+        """
+        with self._lock:
+            pixbuf = self._pixbufs.pop(video.video_id, None)
+            if pixbuf is not None:
+                self._pixbufs[video.video_id] = pixbuf
+                return pixbuf
+
+        pixbuf = self._single_flight.call(video.video_id, self._load, video)
+        if pixbuf is not None:
+            with self._lock:
+                self._pixbufs[video.video_id] = pixbuf
+                while len(self._pixbufs) > self.max_pixbufs:
+                    self._pixbufs.popitem(last=False)
+        return pixbuf
+
+    def _load(self, video):
+        icon_file = NamedTempfile('icon-{0}-{1}.png'.format(self.size, video.video_id),
+                                  auto_open=False)
+        try:
+            return gtk.gdk.pixbuf_new_from_file(icon_file.name)
+        except gobject.GError:
+            # Not cached yet (or broken).
+            pass
+
+        if video.thumbnail_url is None:
+            return None
+        pixbuf = self._decode(video.transport.get(video.thumbnail_url))
+        pixbuf.save(icon_file.name, 'png')
+        return pixbuf
+
+    def _decode(self, data):
+        loader = gtk.gdk.PixbufLoader()
+        # Let the loader scale while decoding, which is a lot cheaper than
+        # decoding at full size and scaling afterwards.
+        loader.connect('size-prepared', lambda loader, width, height:
+                                            loader.set_size(self.size, self.size))
+        try:
+            loader.write(data)
+        finally:
+            loader.close()
+        return loader.get_pixbuf()
@@ -0,0 +1,218 @@
+import zlib
+import socket
+import httplib
+import urlparse
+import threading
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 4
+MAX_REDIRECTS = 5
+
+_CONNECTION_CLASSES = {
+    'http'  : httplib.HTTPConnection,
+    'https' : httplib.HTTPSConnection
+}
+
+
+class HTTPError(IOError):
+    """
+    Raised for any non-2xx response. The status code is available as ``code``.
+    """
+    def __init__(self, url, code, reason):
+        IOError.__init__(self, "HTTP Error {0} for '{1}': {2}".format(code, url, reason))
+        self.url = url
+        self.code = code
+        self.reason = reason
+
+
+class Response(object):
+    """
+    A (possibly not yet fully read) HTTP response.
+
+    The underlying connection goes back into its pool once the body has been
+    read completely using ``read()`` without arguments; call ``close()`` to
+    drop it if the response is abandoned half-way.
+    """
+    def __init__(self, pool, connection, response, url):
+        self.url = url
+        self.status = response.status
+        self.headers = dict((key.lower(), value) for key, value in response.getheaders())
+        self._pool = pool
+        self._connection = connection
+        self._response = response
+        if self.headers.get('content-encoding') == 'gzip':
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = None
+
+    def read(self, size=None):
+        """
+        Reads (and, if necessary, decompresses) at most ``size`` bytes of the
+        body, or all of it if no ``size`` is given. Like with files, an empty
+        string is only returned at the end of the body.
+        """
+        try:
+            return self._read(size)
+        except Exception:
+            # (e.g. a truncated body or a timeout) The connection is of no
+            # use anymore, but its slot in the pool has to be freed.
+            self.close()
+            raise
+
+    def _read(self, size):
+        if size is None:
+            data = self._response.read()
+            if self._decompressor is not None:
+                data = self._decompressor.decompress(data) + self._decompressor.flush()
+            self._release()
+            return data
+
+        while True:
+            data = self._response.read(size)
+            if not data:
+                self._release()
+                if self._decompressor is not None:
+                    return self._decompressor.flush()
+                return data
+            if self._decompressor is None:
+                return data
+            data = self._decompressor.decompress(data)
+            if data:
+                # (a chunk of compressed data may be decompressed to nothing)
+                return data
+
+    def close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._pool.discard()
+            self._connection = None
+
+    def _release(self):
+        if self._connection is not None:
+            self._pool.put(self._connection)
+            self._connection = None
+
+
+class _ConnectionPool(object):
+    """
+    Keeps at most ``size`` keep-alive connections to one host.
+    """
+    def __init__(self, scheme, netloc, size, timeout):
+        self.scheme = scheme
+        self.netloc = netloc
+        self.timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def get(self):
+        """
+        Returns an ``(connection, reused)`` tuple, blocking while all of the
+        pool's connections are in use.
+        """
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+        connection_class = _CONNECTION_CLASSES[self.scheme]
+        return connection_class(self.netloc, timeout=self.timeout), False
+
+    def put(self, connection):
+        with self._lock:
+            self._idle.append(connection)
+        self._slots.release()
+
+    def discard(self):
+        self._slots.release()
+
+
+class HTTPTransport(object):
+    """
+    HTTP client that keeps keep-alive connections to each host around and
+    reuses them for subsequent requests.
+
+    :param pool_size:
+        Maximum number of simultaneous connections per host.
+    :param timeout:
+        Socket timeout in seconds.
+    :param gzip:
+        Whether to ask servers for gzip-compressed responses.
+    :param base_url:
+        If given, all requests are sent to this server (e.g.
+        ``'http://localhost:8000'``) instead of the one in the requested URL;
+        path and query string are kept. Useful for testing and benchmarking
+        against a local stand-in server.
+    """
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 gzip=True, base_url=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.gzip = gzip
+        self.base_url = base_url and urlparse.urlsplit(base_url)
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None):
+        """
+        Sends a GET request for ``url`` and returns the response body.
+        """
+        return self.open(url, headers).read()
+
+    def open(self, url, headers=None, method='GET'):
+        """
+        Sends a request for ``url`` and returns a ``Response`` whose body has
+        not been read yet. Redirects are followed; an ``HTTPError`` is raised
+        for error responses.
+        """
+        for _ in xrange(MAX_REDIRECTS + 1):
+            response = self._request(method, url, headers or {})
+            if response.status in (301, 302, 303, 307) and 'location' in response.headers:
+                response.read()
+                url = urlparse.urljoin(url, response.headers['location'])
+                continue
+            if not 200 <= response.status < 300:
+                reason = response._response.reason
+                response.read()
+                raise HTTPError(url, response.status, reason)
+            if method == 'HEAD':
+                response.read()
+            return response
+        raise HTTPError(url, response.status, 'Too many redirects')
+
+    def _pool_for(self, scheme, netloc):
+        with self._lock:
+            key = (scheme, netloc)
+            if key not in self._pools:
+                self._pools[key] = _ConnectionPool(scheme, netloc,
+                                                   self.pool_size, self.timeout)
+            return self._pools[key]
+
+    def _request(self, method, url, headers):
+        scheme, netloc, path, query, _ = urlparse.urlsplit(url)
+        if self.base_url:
+            scheme, netloc = self.base_url.scheme, self.base_url.netloc
+        if query:
+            path += '?' + query
+        headers = dict(headers, Connection='keep-alive')
+        if self.gzip:
+            headers.setdefault('Accept-Encoding', 'gzip')
+
+        pool = self._pool_for(scheme, netloc)
+        while True:
+            connection, reused = pool.get()
+            try:
+                connection.request(method, path or '/', headers=headers)
+                response = connection.getresponse()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                pool.discard()
+                if reused:
+                    # The server closed the idle connection in the meantime,
+                    # try again with a fresh one.
+                    continue
+                raise
+            return Response(pool, connection, response, url)
+
+
+#: Transport used by ``Video`` instances that were not created by an ``API``.
+default_transport = HTTPTransport()
@@ -0,0 +1,188 @@
+import sys
+import logging
+import itertools
+import threading
+import Queue
+
+log = logging.getLogger(__name__)
+
+
+class Cancelled(Exception):
+    """
+    Raised by ``Job.wait`` for jobs that were cancelled before they were run.
+    """
+
+
+class Job(object):
+    """
+    A unit of work submitted to a ``WorkerPool``.
+
+    Once the job has been run by one of the pool's workers, ``result`` holds
+    the function's return value or, if it raised, ``exc_info`` holds the
+    exception information as returned by ``sys.exc_info()``.
+
+    A job that has been cancelled before a worker picked it up is never run:
+    its ``exc_info`` holds a ``Cancelled`` error and its done callbacks are
+    dropped.
+    """
+    def __init__(self, func, args, kwargs, done_queue=None):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exc_info = None
+        self.cancelled = False
+        self._done_queue = done_queue
+        self._done = threading.Event()
+        self._callbacks = []
+        self._callbacks_lock = threading.Lock()
+
+    def run(self):
+        if self.cancelled:
+            self.exc_info = (Cancelled, Cancelled(), None)
+        else:
+            try:
+                self.result = self.func(*self.args, **self.kwargs)
+            except Exception:
+                self.exc_info = sys.exc_info()
+        with self._callbacks_lock:
+            callbacks, self._callbacks = self._callbacks, None
+        if self._skipped():
+            callbacks = []
+        # (before the callbacks, which may wait for the job as well)
+        self._done.set()
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:
+                # Must not kill the worker thread.
+                log.exception('Error in done callback of %r', self.func)
+        if self._done_queue is not None:
+            self._done_queue.put(self)
+
+    def add_done_callback(self, callback):
+        """
+        Calls ``callback(job)`` once the job has been run, from within the
+        worker thread that ran it (or immediately, if the job is done already).
+        ``callback`` is not called if the job was cancelled before it was run.
+        """
+        with self._callbacks_lock:
+            if self._callbacks is not None:
+                self._callbacks.append(callback)
+                return
+        if not self._skipped():
+            callback(self)
+
+    def cancel(self):
+        """
+        Prevents the job from being run if no worker has picked it up yet.
+        """
+        self.cancelled = True
+
+    def _skipped(self):
+        return self.exc_info is not None and self.exc_info[0] is Cancelled
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job has been run and returns its result, re-raising
+        any exception the job function raised (or ``Cancelled``, if the job
+        was cancelled before it was run).
+        """
+        self._done.wait(timeout)
+        if self.exc_info is not None:
+            raise self.exc_info[0], self.exc_info[1], self.exc_info[2]
+        return self.result
+
+
+class WorkerPool(object):
+    """
+    A bounded pool of daemon worker threads.
+
+    Threads are started lazily, up to ``max_workers``, as jobs are submitted,
+    so an idle pool does not cost anything.
+    """
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self._jobs = Queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Schedules ``func(*args, **kwargs)`` to be run by one of the workers
+        and returns the corresponding ``Job``.
+        """
+        return self._submit(Job(func, args, kwargs))
+
+    def imap_unordered(self, func, iterable, max_pending=None):
+        """
+        Runs ``func(item)`` for every item in ``iterable`` and yields
+        ``(item, result, exc_info)`` tuples in the order the jobs *finish*,
+        not in the order of ``iterable``.
+
+        If ``max_pending`` is given, at most that many of the jobs are
+        submitted (and thus run) at the same time.
+
+        Closing the generator before it is exhausted cancels all jobs that
+        have not been started yet.
+        """
+        done_queue = Queue.Queue()
+        items = iter(iterable)
+        jobs = [self._submit(Job(func, (item,), {}, done_queue))
+                for item in itertools.islice(items, max_pending)]
+        pending = len(jobs)
+        try:
+            while pending:
+                job = done_queue.get()
+                pending -= 1
+                for item in itertools.islice(items, 1):
+                    jobs.append(self._submit(Job(func, (item,), {}, done_queue)))
+                    pending += 1
+                yield job.args[0], job.result, job.exc_info
+        finally:
+            for job in jobs:
+                job.cancel()
+
+    def _submit(self, job):
+        with self._lock:
+            self._jobs.put(job)
+            if len(self._workers) < self.max_workers:
+                worker = threading.Thread(target=self._work)
+                worker.daemon = True
+                self._workers.append(worker)
+                worker.start()
+        return job
+
+    def _work(self):
+        while True:
+            self._jobs.get().run()
+
+
+class SingleFlight(object):
+    """
+    Makes sure that for each key, only one call is in flight at a time.
+
+    Callers that ``call`` with a key while another call with that key is
+    still running do not run their function but wait for the running call
+    and get its result (or exception) instead.
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, func, *args, **kwargs):
+        with self._lock:
+            job = self._calls.get(key)
+            leader = job is None
+            if leader:
+                job = self._calls[key] = Job(func, args, kwargs)
+        if leader:
+            try:
+                job.run()
+            finally:
+                with self._lock:
+                    del self._calls[key]
+        return job.wait()
@@ -1,6 +1,10 @@
 #!/usr/bin/env python
 import thread
 import os
+import logging
+import time
+import itertools
+import collections
 import gobject
 import gtk
 import gst
@@ -14,7 +18,11 @@ import cream.util.string
 import youtube
 
 from throbberwidget import Throbber, MODE_SPINNING, MODE_STATIC
-from buffer import Buffer
+from buffer import Buffer, MEDIA_CACHE_DIR
+from cache import MediaCache
+from prefetch import Prefetcher
+from resolution import AUTO, ResolutionSelector
+from thumbnails import ThumbnailCache
 from common import STATE_BUFFERING, STATE_NULL, STATE_PAUSED, STATE_PLAYING, STATE_LOADING
 from common import Lock, cleanup_markup
 
@@ -24,6 +32,20 @@ YOUTUBE_DEVELOPER_KEY = 'AI39si5ABc6YvX1MST8Q7O-uxN7Ra1ly-KKryqH7pc0fb8MrMvvVzvq
 INTERFACE_FILE = os.path.join(os.path.dirname(__file__), 'interface/interface.ui')
 PLAYER_LOGO    = os.path.join(os.path.dirname(__file__), 'interface/youtube-player.svg')
 ICON_SIZE = 64
+SEARCH_PAGE_SIZE = 25
+PREFETCH_TOP_RESULTS = 3
+# Number of rows above and below the visible ones whose thumbnails are loaded
+THUMBNAIL_PRELOAD_ROWS = 5
+# Maximum time (in seconds) spent inserting result rows per main loop iteration
+ROW_BATCH_TIME_BUDGET = 0.01
+# Maximum number of parallel connections used to download a video
+DOWNLOAD_CONNECTIONS = 4
+# Maximum number of bytes of downloaded videos kept on disk (the least
+# recently played ones are deleted first)
+MEDIA_CACHE_QUOTA = 1024 * 1024 * 1024
+# Seconds of buffered video below which playback is paused to buffer (if it
+# would stall before the end otherwise)
+REBUFFER_SECONDS = 1
 DEFAULT_THUMBNAIL = gtk.gdk.pixbuf_new_from_file(PLAYER_LOGO)\
                     .scale_simple(ICON_SIZE, ICON_SIZE, gtk.gdk.INTERP_HYPER)
 
@@ -44,12 +66,21 @@ class YouTubePlayer(cream.Module):
     fullscreen = False
 
     _current_video_id = None
+    _current_resolution = None
     _seek_timeout = None
+    _pending_seek = None
+    _search_results = None
+    _loading_results = None
 
     def __init__(self):
 
         cream.Module.__init__(self)
         self.videos = {}
+        self._result_rows = {}
+        self._row_markups = {}
+        self._pages_loaded = 0
+        self._thumbnail_jobs = {}
+        self._thumbnails_loaded = set()
 
         # Connect to YouTube:
         self.youtube = youtube.API(YOUTUBE_DEVELOPER_KEY)
@@ -97,9 +128,18 @@ class YouTubePlayer(cream.Module):
 
         self.ui.search_results_treeview.connect('motion-notify-event', _reset_timeout)
         self.ui.search_results_treeview.connect('row-activated', self.row_activated_cb)
+        self.ui.search_results_treeview.get_selection().connect('changed', self.selection_changed_cb)
         self.ui.search_results_treeview.connect('size-allocate', self.treeview_size_allocate_cb)
+        self.ui.search_results_scrolled_window.get_vadjustment().connect('value-changed', self.search_results_scrolled_cb)
+        self.ui.search_results_scrolled_window.get_vadjustment().connect('changed', lambda *args: self.update_visible_thumbnails())
 
-        self.buffer = Buffer()
+        self.resolution_selector = ResolutionSelector(self.youtube.transport)
+        self.prefetcher = Prefetcher(self.choose_resolution,
+                                     rate_cb=self.resolution_selector.add_sample)
+        self.thumbnails = ThumbnailCache(ICON_SIZE)
+
+        self.buffer = Buffer(connections=DOWNLOAD_CONNECTIONS,
+                             media_cache=MediaCache(MEDIA_CACHE_DIR, quota=MEDIA_CACHE_QUOTA))
         self.buffer.connect('update', self.buffer_update_cb)
         self.buffer.connect('ready', lambda *args: self.set_state(STATE_BUFFERING))
 
@@ -133,17 +173,57 @@ class YouTubePlayer(cream.Module):
             self.ui.throbber.set_mode(MODE_SPINNING)
         else:
             self.ui.throbber.set_mode(MODE_STATIC)
+            self.check_buffer()
 
-            try:
-                duration = self.playbin.query_duration(gst.FORMAT_TIME, None)[0]
-            except gst.QueryError:
-                duration = 0
 
-            buffer_length = (position * duration) / 100000000000
-            self.ui.throbber.set_progress(buffer_length / 5.0)
+    def check_buffer(self):
+        """
+        Starts playback as soon as enough of the video is buffered to play
+        it to the end without stalling (see ``Buffer.buffered``), and pauses
+        it to buffer again when it's about to stall.
+        """
+
+        try:
+            duration_ns = self.player.query_duration(gst.FORMAT_TIME, None)[0]
+            position_ns = self.player.query_position(gst.FORMAT_TIME, None)[0]
+        except gst.QueryError:
+            duration_ns = position_ns = 0
+        if self._pending_seek is not None:
+            position_ns = self._pending_seek
 
-            if buffer_length >= 5 and self.state == STATE_BUFFERING:
+        buffered = self.buffer.buffered(position_ns / 1e9, duration_ns / 1e9)
+        if buffered is None:
+            return
+        seconds, required = buffered
+
+        if self.state == STATE_BUFFERING:
+            self.ui.throbber.set_progress(min(1, seconds / required) if required else 1)
+            if seconds >= required:
+                if self._pending_seek is not None:
+                    self._seek(self._pending_seek)
+                    self._pending_seek = None
                 self.set_state(STATE_PLAYING)
+        elif self.state == STATE_PLAYING and required and seconds < REBUFFER_SECONDS:
+            self.set_state(STATE_BUFFERING)
+            self.stalled()
+
+
+    def stalled(self):
+        """
+        Called when playback had to be paused to buffer; switches to a lower
+        resolution in "auto" mode if that happens too often.
+        """
+
+        if self.config.preferred_resolution != AUTO:
+            return
+        video = self.videos[self._current_video_id]
+        if self.resolution_selector.stalled(video, self._current_resolution):
+            try:
+                position_ns = self.player.query_position(gst.FORMAT_TIME, None)[0]
+            except gst.QueryError:
+                position_ns = None
+            thread.start_new_thread(self.load_video, (self._current_video_id,),
+                                    {'position': position_ns})
 
 
     def _seek(self, position):
@@ -155,20 +235,28 @@ class YouTubePlayer(cream.Module):
 
     def seek_cb(self, source, scroll, value):
 
-        fill_level = self.ui.progress_scale.get_fill_level()
-
-        position = min(value, fill_level)
-
         try:
             duration_ns = self.player.query_duration(gst.FORMAT_TIME, None)[0]
         except gst.QueryError:
             duration_ns = 0
 
-        position_ns = (duration_ns / 100.0) * position
+        position_ns = (duration_ns / 100.0) * value
+
+        # Download what's needed to play from there on first.
+        self.buffer.seek(value)
 
         if self._seek_timeout:
             gobject.source_remove(self._seek_timeout)
-        self._seek_timeout = gobject.timeout_add(10, lambda *args: self._seek(position_ns))
+            self._seek_timeout = None
+
+        if self.buffer.is_available(value):
+            self._pending_seek = None
+            self._seek_timeout = gobject.timeout_add(10, lambda *args: self._seek(position_ns))
+        else:
+            # Not downloaded yet; seek as soon as enough data is there.
+            self._pending_seek = position_ns
+            if self.state != STATE_NULL:
+                self.set_state(STATE_BUFFERING)
 
 
     def back_to_search_button_clicked_cb(self, source):
@@ -276,6 +364,14 @@ class YouTubePlayer(cream.Module):
         thread.start_new_thread(self.load_video, (id,))
 
 
+    def selection_changed_cb(self, selection):
+
+        model, iter = selection.get_selected()
+        if iter is not None:
+            # The selected video is likely to be played next.
+            self.prefetcher.prefetch(self.videos[model.get_value(iter, 0)])
+
+
     def play_pause_cb(self, source):
 
         if self.state == STATE_NULL:
@@ -294,6 +390,7 @@ class YouTubePlayer(cream.Module):
         if self.state == STATE_PLAYING:
             gtk_iter = resolution_combobox.get_active_iter()
             self.config.preferred_resolution = self.ui.resolutions_store.get_value(gtk_iter, 0)
+            self.resolution_selector.reset()
             # replay the currently played video with the selected quality.
             # TODO: Remember the seek here and re-seek to that point.
             thread.start_new_thread(self.load_video, (self._current_video_id,))
@@ -306,39 +403,155 @@ class YouTubePlayer(cream.Module):
             sort_by = youtube.SORT_BY_PUBLISHED
 
         self.ui.search_results_liststore.clear()
-        thread.start_new_thread(self._search, (search_string, sort_by))
+        self._result_rows.clear()
+        self._row_markups.clear()
+        self.prefetcher.clear()
+        for job in self._thumbnail_jobs.itervalues():
+            job.cancel()
+        self._thumbnail_jobs.clear()
+        self._thumbnails_loaded.clear()
+        self._pages_loaded = 0
+        self._search_results = self.youtube.search_pages(search_string, sort_by,
+                                                         page_size=SEARCH_PAGE_SIZE)
+        self.load_more_results()
 
 
-    def _search(self, search_string, sort_by, **search_args):
+    def search_results_scrolled_cb(self, adjustment):
 
-        search_result = self.youtube.search(search_string, sort_by, **search_args)
+        self.update_visible_thumbnails()
 
-        for video in search_result:
-            self.videos.setdefault(video.video_id, video)
+        if adjustment.get_value() + adjustment.get_page_size() >= adjustment.get_upper() - ICON_SIZE:
+            # Scrolled to the end of the list.
+            self.load_more_results()
 
-            title = cleanup_markup(video.title)
-            description = '' if video.description is None else cleanup_markup(video.description)
 
-            info = "<b>{title}</b>\n{description}\n{duration}".format(
-                title=title,
-                description=cream.util.string.crop_string(description, 100),
-                duration=convert_ns(int(video.duration) * 1000000000)
-            )
+    def load_more_results(self):
 
-            with gtk.gdk.lock:
-                video._tree_iter = self.ui.search_results_liststore.append((video.video_id, info, None, True))
+        if self._search_results is None or self._loading_results is self._search_results:
+            return
+        self._loading_results = self._search_results
+        thread.start_new_thread(self._search, (self._search_results,))
 
-        for row in self.ui.search_results_liststore:
-            try:
-                video = self.videos[row[0]]
-            except TypeError:
-                print "row[0]:", row[0]
-            if self._request_video_info(video):
-                thumbnail = gtk.gdk.pixbuf_new_from_file(video.download_thumbnail())\
-                            .scale_simple(ICON_SIZE, ICON_SIZE, gtk.gdk.INTERP_HYPER)
-            else:
-                thumbnail = DEFAULT_THUMBNAIL
-            row[2] = thumbnail
+
+    def _search(self, search_results):
+
+        try:
+            # The next page is already being prefetched by ``search_pages``.
+            page = list(itertools.islice(search_results, SEARCH_PAGE_SIZE))
+        finally:
+            if self._loading_results is search_results:
+                self._loading_results = None
+        if search_results is not self._search_results:
+            # A new search was started in the meantime.
+            return
+        is_first_page = not self._pages_loaded
+        self._pages_loaded += 1
+        videos = []
+        rows = collections.deque()
+
+        for video in page:
+            video = self.videos.setdefault(video.video_id, video)
+            videos.append(video)
+            rows.append((video.video_id, self._row_markup(video), DEFAULT_THUMBNAIL, True))
+
+        # Insert the rows from the main loop, a few at a time.
+        gobject.idle_add(self._append_rows_cb, search_results, rows)
+
+        if is_first_page:
+            for video in videos[:PREFETCH_TOP_RESULTS]:
+                self.prefetcher.prefetch(video)
+
+
+    def _row_markup(self, video):
+
+        try:
+            return self._row_markups[video.video_id]
+        except KeyError:
+            pass
+
+        title = cleanup_markup(video.title)
+        description = '' if video.description is None else cleanup_markup(video.description)
+
+        markup = self._row_markups[video.video_id] = "<b>{title}</b>\n{description}\n{duration}".format(
+            title=title,
+            description=cream.util.string.crop_string(description, 100),
+            duration=convert_ns(int(video.duration) * 1000000000)
+        )
+        return markup
+
+
+    def _append_rows_cb(self, search_results, rows):
+
+        if search_results is not self._search_results:
+            # A new search was started in the meantime.
+            return False
+
+        deadline = time.time() + ROW_BATCH_TIME_BUDGET
+        while rows:
+            row = rows.popleft()
+            self._result_rows[row[0]] = self.ui.search_results_liststore.append(row)
+            if rows and time.time() > deadline:
+                # Give the main loop a chance to handle other events.
+                return True
+
+        self.update_visible_thumbnails()
+        return False
+
+
+    def update_visible_thumbnails(self):
+        """
+        Starts loading the thumbnails (and video infos) of the rows that
+        are visible or close to the visible part of the results list and
+        cancels the loading of rows that have been scrolled away from.
+        """
+
+        visible_range = self.ui.search_results_treeview.get_visible_range()
+        if visible_range is None:
+            return False
+
+        model = self.ui.search_results_liststore
+        first = max(0, visible_range[0][0] - THUMBNAIL_PRELOAD_ROWS)
+        last = min(len(model) - 1, visible_range[1][0] + THUMBNAIL_PRELOAD_ROWS)
+        wanted = set(model[index][0] for index in xrange(first, last + 1))
+
+        for video_id, job in self._thumbnail_jobs.items():
+            if video_id not in wanted:
+                # (only has an effect if the job has not been started yet)
+                job.cancel()
+                del self._thumbnail_jobs[video_id]
+
+        for video_id in wanted - self._thumbnails_loaded - set(self._thumbnail_jobs):
+            job = self.youtube.pool.submit(self._load_thumbnail, self.videos[video_id])
+            job.add_done_callback(lambda job: gobject.idle_add(self._thumbnail_loaded_cb, job))
+            self._thumbnail_jobs[video_id] = job
+
+        return False
+
+
+    def _thumbnail_loaded_cb(self, job):
+
+        video = job.args[0]
+        if job.cancelled or video.video_id not in self._result_rows:
+            # Scrolled away, or a new search was started in the meantime.
+            return False
+        if self._thumbnail_jobs.get(video.video_id) is job:
+            del self._thumbnail_jobs[video.video_id]
+        self._thumbnails_loaded.add(video.video_id)
+
+        if job.exc_info is None:
+            thumbnail = job.result
+        else:
+            thumbnail = DEFAULT_THUMBNAIL
+            if isinstance(job.exc_info[1], youtube.YouTubeError):
+                self._mark_unavailable(video, job.exc_info[1])
+        self.ui.search_results_liststore.set_value(self._result_rows[video.video_id], 2, thumbnail)
+        return False
+
+
+    def _load_thumbnail(self, video):
+
+        video.request_video_info()
+        return self.thumbnails.get(video) or DEFAULT_THUMBNAIL
 
 
     def _request_video_info(self, video):
@@ -346,13 +559,28 @@ class YouTubePlayer(cream.Module):
             video.request_video_info()
             return True
         except youtube.YouTubeError, exc:
-            self.ui.search_results_liststore.set_value(video._tree_iter, 1, cleanup_markup(exc.reason))
-            self.ui.search_results_liststore.set_value(video._tree_iter, 3, False)
+            self._mark_unavailable(video, exc)
             return False
 
 
+    def _mark_unavailable(self, video, exc):
+        tree_iter = self._result_rows.get(video.video_id)
+        if tree_iter is None:
+            # not part of the current search results
+            return
+        # (the markup is outdated now)
+        self._row_markups.pop(video.video_id, None)
+        self.ui.search_results_liststore.set_value(tree_iter, 1, cleanup_markup(exc.reason))
+        self.ui.search_results_liststore.set_value(tree_iter, 3, False)
+
+
     def update_progressbar(self):
 
+        # (The download might have stalled, so there's no 'update'.)
+        if self.state in [STATE_BUFFERING, STATE_PLAYING]:
+            with gtk.gdk.lock:
+                self.check_buffer()
+
         try:
             duration_ns = self.player.query_duration(gst.FORMAT_TIME, None)[0]
             position_ns = self.player.query_position(gst.FORMAT_TIME, None)[0]
@@ -446,11 +674,32 @@ class YouTubePlayer(cream.Module):
                     self.ui.throbber.show()
 
 
-    def load_video(self, id, play=True):
+    def choose_resolution(self, video):
+
+        resolution = self.config.preferred_resolution
+        if resolution == AUTO:
+            # (may be called from the prefetcher's threads too)
+            resolution = self.resolution_selector.choose(video)
+        if resolution not in video.stream_urls:
+            # preferred resolution not available, use the
+            # highest possible
+            resolution = video.stream_urls.iterkeys().next()
+        return resolution
+
+
+    def load_video(self, id, play=True, position=None):
+        """
+        Loads the video ``id`` and, if ``play`` is true, starts playing it
+        (at ``position`` nanoseconds, if given) as soon as enough of it has
+        been buffered.
+        """
 
         self.ui.slider.slide_to(self.ui.info_box)
 
         self.set_state(STATE_NULL)
+        self._pending_seek = None
+        # (the throughput of the previous video's download)
+        self.resolution_selector.add_sample(self.buffer.rate)
 
         video = self.videos[id]
         self._request_video_info(video)
@@ -459,11 +708,7 @@ class YouTubePlayer(cream.Module):
         self.ui.info_label_description.set_text(video.description or '')
         self.ui.show_subtitles_btn.set_sensitive(video.has_subtitles)
 
-        resolution = self.config.preferred_resolution
-        if resolution not in video.stream_urls:
-            # preferred resolution not available, use the
-            # highest possible
-            resolution = video.stream_urls.iterkeys().next()
+        resolution = self.choose_resolution(video)
         self.ui.resolutions_store.clear()
 
         for resolution_name in youtube.RESOLUTIONS.itervalues():
@@ -473,9 +718,21 @@ class YouTubePlayer(cream.Module):
                     self.ui.resolution_chooser.set_active_iter(gtk_iter)
 
         video_url = video.stream_urls[resolution]
-        tmp_video_url = self.buffer.load(video_url)
+
+        def refresh_video_url():
+            video.request_video_info(refresh=True)
+            return video.stream_urls[resolution]
+
+        tmp_video_url = self.buffer.load(video_url, id, resolution,
+                                         head=self.prefetcher.take(id, resolution),
+                                         refresh_uri=refresh_video_url)
         self.playbin.set_property('uri', 'file://{0}'.format(tmp_video_url))
         self._current_video_id = id
+        self._current_resolution = resolution
+        if position and video.duration:
+            # (seeks once buffered, see ``check_buffer``)
+            self._pending_seek = position
+            self.buffer.seek(position / 1e9 / video.duration * 100)
         self.buffer.set_state(STATE_PLAYING)
 
         if play:
@@ -514,6 +771,8 @@ class YouTubePlayer(cream.Module):
 
 
 if __name__ == '__main__':
+    # (``resolution`` logs what its decisions are based on)
+    logging.basicConfig(level=logging.INFO)
     gtk.gdk.threads_init()
     youtube_player = YouTubePlayer()
     youtube_player.main()
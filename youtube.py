@@ -1,17 +1,24 @@
+import os
 import re
-import urllib2
+import time
 import urlparse
+import urllib
 import datetime
+import collections
+import tempfile
+import threading
 from lxml.etree import XMLSyntaxError, parse as parse_xml, \
                        fromstring as parse_xml_from_string
 
-import gdata.youtube
-import gdata.youtube.service
-from cream.util import cached_property
 from cream.util.dicts import ordereddict
-from common import NamedTempfile
+from common import NamedTempfile, DEFAULT_TEMPFILE_DIR
+from cache import MetadataCache, SearchCache
+from workers import WorkerPool, SingleFlight
+from feed import parse_feed, fields_projection
+from transport import HTTPTransport, default_transport
 
 
+SEARCH_FEED_URL     = 'http://gdata.youtube.com/feeds/api/videos?{query}'
 VIDEO_INFO_URL      = 'http://www.youtube.com/get_video_info?video_id={video_id}'
 SUBTITLE_LIST_URL   = 'http://video.google.com/timedtext?tlangs=1&type=list&v={video_id}'
 SUBTITLE_GET_URL    = 'http://video.google.com/timedtext?type=track&v={video_id}&lang={language_code}'
@@ -22,6 +29,29 @@ or send a mail to cream@cream-project.org" including the following information:
     Video-ID: {video_id}
 Thank you!"""
 
+#: ``get_video_info`` fields that contain (expiring) stream URLs
+STREAM_FIELDS = ('fmt_url_map',)
+
+#: Time-to-live of the cached ``get_video_info`` fields, in seconds.
+#: Stream URLs expire after some hours; everything else is kept for a week.
+VIDEO_INFO_TTLS = dict.fromkeys(STREAM_FIELDS + ('fmt_stream_map', 'fmt_list', 'token'), 60*60)
+VIDEO_INFO_DEFAULT_TTL = 7*24*60*60
+
+#: Time-to-live of cached failures (unavailable videos and subtitles)
+NEGATIVE_CACHE_TTL = 60*60
+
+#: ``Video`` attributes an ``API`` sets on the videos it creates
+VIDEO_CONTEXT_ATTRIBUTES = ('transport', 'metadata_cache', 'negative_cache', 'pool')
+
+#: ``Video`` slots holding the information found in search feeds
+_FEED_SLOTS = ('video_id', 'title', 'description', 'category', 'uri') + tuple(
+    prefix + name for name in ('datetime', 'tags', 'duration', 'view_count', 'rating')
+                  for prefix in ('_raw_', '_')
+)
+
+#: YouTube does not return more results than that for a single search
+MAX_SEARCH_RESULTS = 1000
+
 # Ordering options
 SORT_BY_RELEVANCE  = 'relevance'
 SORT_BY_VIEW_COUNT = 'viewCount'
@@ -41,6 +71,52 @@ RESOLUTIONS = ordereddict((
 class YouTubeError(Exception):
     pass
 
+
+def _unavailable(message, reason):
+    exc = YouTubeError(message)
+    exc.reason = reason
+    return exc
+
+def _cache_path(name):
+    return os.path.join(tempfile.gettempdir(), DEFAULT_TEMPFILE_DIR, name)
+
+def _default_metadata_cache():
+    return MetadataCache(_cache_path('metadata.sqlite'),
+                         ttls=VIDEO_INFO_TTLS,
+                         default_ttl=VIDEO_INFO_DEFAULT_TTL)
+
+def _default_negative_cache():
+    return MetadataCache(_cache_path('negative.sqlite'),
+                         default_ttl=NEGATIVE_CACHE_TTL)
+
+#: Factories for the context of ``Video`` instances that were not
+#: created by an ``API`` (see ``default_context``)
+_DEFAULT_CONTEXT_FACTORIES = {
+    'transport': lambda: default_transport,
+    'metadata_cache': _default_metadata_cache,
+    'negative_cache': _default_negative_cache,
+    'pool': WorkerPool,
+}
+_default_context = {}
+_default_context_lock = threading.Lock()
+
+def default_context(name):
+    """
+    Returns the ``name`` context attribute (one of
+    ``VIDEO_CONTEXT_ATTRIBUTES``) shared by all ``Video`` objects that
+    were not created by an ``API``. It is created on first use, so that
+    importing this module neither opens the caches nor starts a pool.
+    """
+    with _default_context_lock:
+        try:
+            return _default_context[name]
+        except KeyError:
+            value = _default_context[name] = _DEFAULT_CONTEXT_FACTORIES[name]()
+            return value
+
+_single_flight = SingleFlight()
+
+
 class _VideoInfoProperty(property):
     """
     Property used to hide the ``Video.video_info`` dict
@@ -83,6 +159,48 @@ class _VideoInfoProperty(property):
         else:
             return self.conversion_func(var)
 
+def _to_datetime(s):
+    return datetime.datetime.strptime(s, '%Y-%m-%dT%H:%M:%S.000Z')
+
+def _split_tags(s):
+    if not s:
+        return None
+    return map(str.split, s.split(','))
+
+def _int_or_none(s):
+    return s and int(s) or None
+
+def _float_or_none(s):
+    return s and float(s) or None
+
+
+class _LazyFeedAttribute(object):
+    """
+    Descriptor for ``Video`` attributes that are stored as the raw string
+    found in the feed and converted using ``decode`` on first access only.
+
+    The raw value lives in the ``_raw_<name>`` slot, the decoded one in
+    ``_<name>``. Assigning to the attribute sets the decoded value directly.
+    """
+    def __init__(self, name, decode):
+        self.raw_slot = '_raw_' + name
+        self.slot = '_' + name
+        self.decode = decode
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        try:
+            return getattr(obj, self.slot)
+        except AttributeError:
+            value = self.decode(getattr(obj, self.raw_slot))
+            setattr(obj, self.slot, value)
+            return value
+
+    def __set__(self, obj, value):
+        setattr(obj, self.slot, value)
+
+
 class Video(object):
     """
     Represents a YouTube video.
@@ -95,17 +213,59 @@ class Video(object):
         42
         >>> video.bar
         'hello world'
+
+    All network requests go through ``transport`` (an
+    ``transport.HTTPTransport``) and video information is cached in
+    ``metadata_cache`` (a ``cache.MetadataCache``). Failures (unavailable
+    videos or subtitles) are remembered in ``negative_cache`` (another
+    ``cache.MetadataCache``) for a shorter time. The ``*_async`` methods
+    run on the ``pool`` (a ``workers.WorkerPool``). All of these may be
+    passed as keyword arguments too.
+
+    To keep large numbers of search results cheap, all attributes known from
+    the feed are stored in slots, and those that need conversion (like
+    ``datetime``) are converted on first access only.
     """
+    __slots__ = _FEED_SLOTS + VIDEO_CONTEXT_ATTRIBUTES + (
+        '_video_info', '_video_info_expires', '_stream_urls',
+        '_thumbnail_path', '_subtitle_list', '_subtitles',
+        # for arbitrary other attributes
+        '__dict__'
+    )
+
+    datetime    = _LazyFeedAttribute('datetime', _to_datetime)
+    tags        = _LazyFeedAttribute('tags', _split_tags)
+    duration    = _LazyFeedAttribute('duration', int)
+    view_count  = _LazyFeedAttribute('view_count', _int_or_none)
+    rating      = _LazyFeedAttribute('rating', _float_or_none)
 
     def __init__(self, **attributes):
+        for key in VIDEO_CONTEXT_ATTRIBUTES:
+            if key not in attributes:
+                setattr(self, key, default_context(key))
         for key, value in attributes.iteritems():
             setattr(self, key, value)
 
     def __repr__(self):
         return '<YouTubeVideo id={0}>'.format(self.video_id)
 
+    def __getstate__(self):
+        # Only pickle the video's meta data, not its transport, cache
+        # or any (private) runtime state.
+        state = dict((key, value) for key, value in self.__dict__.iteritems()
+                     if not key.startswith('_'))
+        for slot in _FEED_SLOTS:
+            try:
+                state[slot] = getattr(self, slot)
+            except AttributeError:
+                pass
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
     @classmethod
-    def from_feed_entry(cls, feed_entry):
+    def from_feed_entry(cls, feed_entry, **attributes):
         """
         Creates a new instance from a ``gdata.youtube.YouTubeVideoEntry`` and
         extracts the following information from that entry:
@@ -122,27 +282,21 @@ class Video(object):
         * *datetime* (``datetime.datetime``)
 
         All attributes mentioned end up as instance attributes like
-        described in the documentation for ``Video``.
+        described in the documentation for ``Video``, as do any additional
+        keyword ``attributes``.
         """
-        def _to_datetime(s):
-            return datetime.datetime.strptime(s, '%Y-%m-%dT%H:%M:%S.000Z')
-
-        def _split_tags(s):
-            if not s:
-                return None
-            return map(str.split, s.split(','))
-
         return cls(
-            title       = feed_entry.media.title.text,
-            datetime    = _to_datetime(feed_entry.published.text),
-            description = feed_entry.media.description.text,
-            category    = feed_entry.media.category[0].text,
-            tags        = _split_tags(feed_entry.media.keywords.text),
-            uri         = feed_entry.media.player.url,
-            duration    = int(feed_entry.media.duration.seconds),
-            view_count  = feed_entry.statistics and int(feed_entry.statistics.view_count) or None,
-            rating      = feed_entry.rating and float(feed_entry.rating.average) or None,
-            video_id    = feed_entry.id.text.split('/')[-1]
+            title           = feed_entry.media.title.text,
+            _raw_datetime   = feed_entry.published.text,
+            description     = feed_entry.media.description.text,
+            category        = feed_entry.media.category[0].text,
+            _raw_tags       = feed_entry.media.keywords.text,
+            uri             = feed_entry.media.player.url,
+            _raw_duration   = feed_entry.media.duration.seconds,
+            _raw_view_count = feed_entry.statistics and feed_entry.statistics.view_count,
+            _raw_rating     = feed_entry.rating and feed_entry.rating.average,
+            video_id        = feed_entry.id.text.split('/')[-1],
+            **attributes
         )
 
     #: URL to the video's thumbnail
@@ -151,41 +305,54 @@ class Video(object):
     has_subtitles   = _VideoInfoProperty('has_cc', type=lambda x:x == 'True')
 
 
-    def request_video_info(self):
+    def request_video_info(self, refresh=False):
         """
         Sends a HTTP request to the YouTube servers asking for additional
         information about the video.
 
         Note that this method has to be called before accessing ``video_info`` and some
         other attributes that depend on it (like ``stream_urls`` or ``thumbnail_url``)!
+
+        If ``refresh`` is true, cached information is thrown away and requested
+        again (e.g., because the stream URLs have expired earlier than expected).
         """
-        if hasattr(self, '_video_info'):
+        if refresh:
+            self.metadata_cache.delete(self.video_id)
+        elif hasattr(self, '_video_info') and time.time() < self._video_info_expires:
             # All work already done, do nothing.
             return
-        tempfile = NamedTempfile(self.video_id+'-info')
-        if tempfile.isempty():
-            raw_data = urllib2.urlopen(VIDEO_INFO_URL.format(video_id=self.video_id)).read()
-            with tempfile:
-                tempfile.file.write(raw_data)
+        # Concurrent requests for the same video share a single HTTP request.
+        info, expires = _single_flight.call(('video_info', self.video_id),
+                                            self._fetch_video_info)
+        self._video_info = info
+        self._video_info_expires = expires
+        self._stream_urls = None
+
+    def _fetch_video_info(self):
+        cached = self.metadata_cache.get(self.video_id, required=STREAM_FIELDS)
+        if cached is not None:
+            return cached
+
+        failure = self.negative_cache.get(self.video_id)
+        if failure is None:
+            raw_data = self.transport.get(VIDEO_INFO_URL.format(video_id=self.video_id))
+            info = urlparse.parse_qs(raw_data)
+            if info['status'][0] == 'ok':
+                self.metadata_cache.set(self.video_id, info)
+                return info, time.time() + min(map(self.metadata_cache.ttl_for, STREAM_FIELDS))
+            reason = info['reason'][0]
+            self.negative_cache.set(self.video_id, {'reason': reason})
         else:
-            with tempfile:
-                raw_data = tempfile.file.read()
-
-        info = urlparse.parse_qs(raw_data)
-        if info['status'][0] != 'ok':
-            try:
-                video_title = "('" + self.title + "')"
-            except AttributeError:
-                video_title = ''
-            exc = YouTubeError(
-                "Could not get video information about video '%s' %s: %s" % (
-                    self.video_id, video_title, info['reason'][0]
-            ))
-            exc.reason = info['reason'][0]
-            raise exc
+            reason = failure[0]['reason']
 
-        else:
-            self._video_info = info
+        try:
+            video_title = "('" + self.title + "')"
+        except AttributeError:
+            video_title = ''
+        raise _unavailable(
+            "Could not get video information about video '%s' %s: %s" % (
+                self.video_id, video_title, reason
+            ), reason)
 
     @property
     def video_info(self):
@@ -201,7 +368,7 @@ class Video(object):
             raise RuntimeError("Cannot access 'video_info': Make sure to request "
                                "it using 'request_video_info' first.")
 
-    @cached_property
+    @property
     def stream_urls(self):
         """
         A dictionary of directly streamable URLs in all resolutions that are
@@ -209,6 +376,11 @@ class Video(object):
 
         (``request_video_info`` has to be called before accessing this property)
         """
+        if getattr(self, '_stream_urls', None) is None:
+            self._stream_urls = self._parse_stream_urls()
+        return self._stream_urls
+
+    def _parse_stream_urls(self):
         urls = dict()
         for item in self.video_info['fmt_url_map'][0].split(','):
             resolution_id, stream_url = item.split('|')
@@ -250,18 +422,22 @@ class Video(object):
 
         (``request_video_info`` has to be called before accessing this property)
         """
-        return self._thumbnail_path
-
-    @cached_property
-    def _thumbnail_path(self):
-        if self.thumbnail_url is None:
-            return None
+        try:
+            return self._thumbnail_path
+        except AttributeError:
+            if self.thumbnail_url is None:
+                self._thumbnail_path = None
+            else:
+                self._thumbnail_path = _single_flight.call(
+                    ('thumbnail', self.thumbnail_url), self._download_thumbnail)
+            return self._thumbnail_path
 
+    def _download_thumbnail(self):
         tempfile = NamedTempfile('thumbnail-'+self.video_id)
         if tempfile.isempty():
             # download the thumbnail if not already done so.
             with tempfile:
-                tempfile.file.write(urllib2.urlopen(self.thumbnail_url).read())
+                tempfile.file.write(self.transport.get(self.thumbnail_url))
         return tempfile.name
 
     def request_subtitle_list(self):
@@ -269,22 +445,28 @@ class Video(object):
             # All work is done, do nothing.
             return self._subtitle_list
 
-        self._subtitle_list = dict()
+        url = SUBTITLE_LIST_URL.format(video_id=self.video_id)
+        subtitle_list = _single_flight.call(('subtitle_list', url),
+                                            self._fetch_subtitle_list, url)
         self._subtitles = dict()
+        self._subtitle_list = subtitle_list
+
+    def _fetch_subtitle_list(self, url):
+        subtitle_list = dict()
         try:
             # XXX: The following breaks lxml and I don't know why.
             # I'll file a bug report.
             #xml = parse_xml(SUBTITLE_LIST_URL.format(video_id=self.video_id))
-            url = SUBTITLE_LIST_URL.format(video_id=self.video_id)
-            xmltree = parse_xml_from_string(urllib2.urlopen(url).read())
+            xmltree = parse_xml_from_string(self.transport.get(url))
         except XMLSyntaxError, exc:
             if str(exc) not in ('Document is empty', 'None'):
                 raise
             else:
                 # no subtitles
-                return
+                return subtitle_list
         for child in xmltree:
-            self._subtitle_list[child.attrib['lang_code']] = child.attrib
+            subtitle_list[child.attrib['lang_code']] = child.attrib
+        return subtitle_list
 
     @property
     def subtitle_list(self):
@@ -336,24 +518,34 @@ class Video(object):
             # All work done, just returned the cached subtitles.
             return self._subtitles[language]
 
-        tempfile = NamedTempfile(self.video_id+'-subtitle-'+language+'.xml')
-        if tempfile.isempty():
-            subtitle_url = SUBTITLE_GET_URL.format(video_id=self.video_id, language_code=language)
-            with tempfile:
-                tempfile.file.write(urllib2.urlopen(subtitle_url).read())
-            if tempfile.isempty():
-                raise YouTubeError("Subtitle for video '{0}' not available in '{1}'"\
-                                   .format(self.video_id, language))
+        subtitle_url = SUBTITLE_GET_URL.format(video_id=self.video_id, language_code=language)
+        xmlfile = _single_flight.call(('subtitle', subtitle_url),
+                                      self._download_subtitle, subtitle_url, language)
 
         if format == 'xml':
-            return tempfile.name
+            return xmlfile
         #elif format == 'json':
-        #    return self._subtitle_file_to_json(tempfile.name, language)
+        #    return self._subtitle_file_to_json(xmlfile, language)
         elif format == 'mpl2':
-            return self._subtitle_file_as_mpl2(tempfile.name, language)
+            return self._subtitle_file_as_mpl2(xmlfile, language)
         else:
             raise TypeError("Unknown subtitle format '%s'" % format)
 
+    def _download_subtitle(self, subtitle_url, language):
+        message = "Subtitle for video '{0}' not available in '{1}'".format(self.video_id, language)
+        if self.negative_cache.get(subtitle_url) is not None:
+            raise _unavailable(message, 'not available')
+
+        tempfile = NamedTempfile(self.video_id+'-subtitle-'+language+'.xml')
+        if tempfile.isempty():
+            with tempfile:
+                tempfile.file.write(self.transport.get(subtitle_url))
+            if tempfile.isempty():
+                tempfile.delete()
+                self.negative_cache.set(subtitle_url, {'reason': 'not available'})
+                raise _unavailable(message, 'not available')
+        return tempfile.name
+
 
     def _subtitle_file_as_mpl2(self, xmlfile, language):
         # see http://lists.mplayerhq.hu/pipermail/mplayer-users/2003-February/030222.html
@@ -369,23 +561,208 @@ class Video(object):
                tempfile.file.write('[{0}][{1}]{2}\n'.format(start, end, text))
         return tempfile.name
 
+    # Non-blocking variants of the methods above. Each of them returns a
+    # ``workers.Job``; see ``workers.Job.wait`` and ``add_done_callback``.
+
+    def request_video_info_async(self):
+        return self.pool.submit(self.request_video_info)
+
+    def download_thumbnail_async(self):
+        return self.pool.submit(self.download_thumbnail)
+
+    def request_subtitle_list_async(self):
+        return self.pool.submit(self.request_subtitle_list)
+
+    def download_subtitle_async(self, language, format='xml'):
+        return self.pool.submit(self.download_subtitle, language, format)
+
 
 class API(object):
+    """
+    Entry point for searching YouTube.
+
+    :param max_workers:
+        Size of the worker pool used by ``fetch_video_infos`` and the
+        ``*_async`` methods, i.e. the maximum number of requests that run
+        concurrently.
+    :param transport:
+        The ``transport.HTTPTransport`` used for all requests of the ``Video``
+        objects this API creates. By default, a new one is created.
+    :param metadata_cache:
+        The ``cache.MetadataCache`` the ``Video`` objects this API creates
+        store their video information in. Defaults to the cache shared by
+        all ``Video`` objects.
+    :param negative_cache:
+        The ``cache.MetadataCache`` failed video info and subtitle requests
+        are remembered in. Defaults to the cache shared by all ``Video``
+        objects.
+    :param search_cache:
+        The ``cache.SearchCache`` search results are kept in. By default,
+        results are cached in memory only.
+    """
 
-    def __init__(self, developer_key):
+    #: Value for the ``fields`` query parameter used by default, derived
+    #: from the feed elements the ``Video`` objects are created from
+    feed_fields = fields_projection()
+
+    def __init__(self, developer_key, max_workers=8, transport=None,
+                 metadata_cache=None, negative_cache=None, search_cache=None):
+
+        self.developer_key = developer_key
+        self.pool = WorkerPool(max_workers)
+        self.transport = transport or HTTPTransport(pool_size=max_workers)
+        if metadata_cache is None:
+            metadata_cache = default_context('metadata_cache')
+        self.metadata_cache = metadata_cache
+        if negative_cache is None:
+            negative_cache = default_context('negative_cache')
+        self.negative_cache = negative_cache
+        if search_cache is None:
+            search_cache = SearchCache()
+        self.search_cache = search_cache
+
+    @property
+    def cache_hits(self):
+        """Number of video info requests answered from the metadata cache."""
+        return self.metadata_cache.hits
+
+    @property
+    def cache_misses(self):
+        """Number of video info requests that had to go to YouTube."""
+        return self.metadata_cache.misses
+
+    @property
+    def negative_cache_hits(self):
+        """Number of requests known to fail without asking YouTube again."""
+        return self.negative_cache.hits
 
-        self.service = gdata.youtube.service.YouTubeService()
-        self.service.developer_key = developer_key
 
+    def search(self, search_string, order_by=SORT_BY_RELEVANCE, revalidate=False, **query_args):
+        """
+        Searches YouTube for ``search_string`` and yields the results as
+        ``Video`` objects.
+
+        Results are cached in ``search_cache``; repeating a search returns
+        the very same ``Video`` objects without sending any request. If
+        ``revalidate`` is true, cached results are refreshed in the
+        background for subsequent searches.
 
-    def search(self, search_string, order_by=SORT_BY_RELEVANCE, **query_args):
+        Only the parts of the feed needed to create the ``Video`` objects are
+        requested (see ``feed_fields``). To request other parts, pass a
+        different ``fields`` value; pass ``fields=None`` for the full feed.
+        """
+        key = (search_string, order_by, tuple(sorted(query_args.iteritems())))
+        cached = self.search_cache.get(key)
+        if cached is None:
+            # Hand out the videos while the feed is still being received.
+            videos = []
+            for video in self._query(search_string, order_by, query_args):
+                videos.append(video)
+                yield video
+            self.search_cache.set(key, videos)
+            return
 
-        query = gdata.youtube.service.YouTubeVideoQuery()
-        query.vq = search_string
-        query.orderby = order_by
-        query.racy = 'include'
+        videos = cached[0]
+        for video in videos:
+            # Videos loaded from a persistent cache lose these.
+            for name in VIDEO_CONTEXT_ATTRIBUTES:
+                setattr(video, name, getattr(self, name))
+        if revalidate:
+            self.pool.submit(self._search, key, search_string, order_by, query_args)
+
+        for video in videos:
+            yield video
+
+    def _search(self, key, search_string, order_by, query_args):
+        videos = list(self._query(search_string, order_by, query_args))
+        self.search_cache.set(key, videos)
+        return videos
+
+    def _query(self, search_string, order_by, query_args):
+        # Partial responses (``fields``) require version 2 of the API.
+        query = dict(v=2, q=search_string, orderby=order_by, safeSearch='none')
+        query['fields'] = self.feed_fields
         query.update(query_args)
-        feed = self.service.YouTubeQuery(query)
+        if not query['fields']:
+            del query['fields']
+        url = SEARCH_FEED_URL.format(query=urllib.urlencode(query))
+        response = self.transport.open(url, {'X-GData-Key': 'key=' + self.developer_key})
+        context = dict((name, getattr(self, name)) for name in VIDEO_CONTEXT_ATTRIBUTES)
+        try:
+            for fields in parse_feed(response):
+                fields.update(context)
+                yield Video(**fields)
+        finally:
+            response.close()
+
+    def search_pages(self, search_string, order_by=SORT_BY_RELEVANCE,
+                     page_size=25, prefetch=1, **query_args):
+        """
+        Like ``search``, but walks through all result pages (using the
+        ``start-index`` and ``max-results`` query parameters) instead of
+        yielding only the first ``page_size`` results.
 
-        for entry in feed.entry:
-            yield Video.from_feed_entry(entry)
+        While the results of one page are consumed, the next ``prefetch``
+        pages are requested in the background. Closing the generator (or
+        dropping all references to it) cancels pending page requests.
+        """
+        def _fetch_page(index):
+            page_args = dict(query_args)
+            page_args['start-index'] = index * page_size + 1
+            page_args['max-results'] = page_size
+            return list(self.search(search_string, order_by, **page_args))
+
+        pending = collections.deque()
+        next_page = 0
+        try:
+            while True:
+                while len(pending) <= prefetch and \
+                      next_page * page_size < MAX_SEARCH_RESULTS:
+                    pending.append(self.pool.submit(_fetch_page, next_page))
+                    next_page += 1
+                if not pending:
+                    return
+                videos = pending.popleft().wait()
+                for video in videos:
+                    yield video
+                if len(videos) < page_size:
+                    # That was the last page.
+                    return
+        finally:
+            for job in pending:
+                job.cancel()
+
+    def search_async(self, search_string, order_by=SORT_BY_RELEVANCE, **query_args):
+        """
+        Non-blocking variant of ``search``. Returns a ``workers.Job`` whose
+        result is the list of ``Video`` objects found.
+        """
+        return self.pool.submit(lambda: list(self.search(search_string, order_by, **query_args)))
+
+    def fetch_video_infos(self, videos, thumbnails=True, max_workers=None):
+        """
+        Requests the video info (and, if ``thumbnails`` is true, the
+        thumbnail) for all ``videos`` concurrently.
+
+        Yields ``(video, exc)`` tuples as soon as each video is done, in
+        completion order. ``exc`` is ``None`` on success or the
+        ``YouTubeError`` that occured while requesting the video info.
+        Any other exception is re-raised.
+
+        :param max_workers:
+            If given, at most that many videos are requested at the same
+            time (on the ``API``'s shared pool).
+        """
+
+        def _fetch(video):
+            video.request_video_info()
+            if thumbnails:
+                video.download_thumbnail()
+
+        for video, _, exc_info in self.pool.imap_unordered(_fetch, videos, max_workers):
+            if exc_info is None:
+                yield video, None
+            elif isinstance(exc_info[1], YouTubeError):
+                yield video, exc_info[1]
+            else:
+                raise exc_info[0], exc_info[1], exc_info[2]